@@ -0,0 +1,103 @@
+# Build manifest for incremental site generation
+
+import hashlib
+import json
+
+# Bump when the layout of the manifest file changes
+_MANIFEST_FORMAT = 1
+
+
+def hash_bytes(data):
+    """Returns the hex digest used for all manifest hashes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class BuildManifest:
+    """
+    Records the inputs of every output file written by a build.
+
+    For each output file, the manifest stores the list of input files it was
+    rendered from (the INI, display_name and install_info files of the node and
+    its ancestors, and the page templates) and a key summarizing everything
+    else the output depends on (e.g. the names of sibling versions). Together
+    with the content hashes of all input files, this allows a later build to
+    re-render only the outputs whose inputs changed.
+    """
+
+    def __init__(self, generator_hash):
+        self.generator_hash = generator_hash
+        self.inputs = dict()  # input path -> content hash
+        self.outputs = dict()  # output path -> (dependency list, key)
+
+    @classmethod
+    def load(cls, manifest_path, generator_hash):
+        """
+        Loads the manifest at manifest_path.
+
+        Returns an empty manifest if the file does not exist, is unreadable,
+        or was written by a different version of the generator.
+        """
+        empty_manifest = cls(generator_hash)
+        try:
+            with manifest_path.open() as manifest_file:
+                raw_manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return empty_manifest
+        if raw_manifest.get('format') != _MANIFEST_FORMAT:
+            return empty_manifest
+        if raw_manifest.get('generator') != generator_hash:
+            return empty_manifest
+        manifest = cls(generator_hash)
+        manifest.inputs = raw_manifest['inputs']
+        manifest.outputs = {
+            output: (dependencies, key)
+            for output, (dependencies, key) in raw_manifest['outputs'].items()
+        }
+        return manifest
+
+    def dumps(self):
+        """Returns the manifest as a JSON string"""
+        raw_manifest = {
+            'format': _MANIFEST_FORMAT,
+            'generator': self.generator_hash,
+            'inputs': self.inputs,
+            'outputs': self.outputs,
+        }
+        return json.dumps(raw_manifest, sort_keys=True)
+
+    def hash_input(self, input_path):
+        """Hashes and records the contents of input_path"""
+        key = str(input_path)
+        if key not in self.inputs:
+            self.inputs[key] = hash_bytes(input_path.read_bytes())
+        return self.inputs[key]
+
+    def record(self, output_path, dependencies, key_parts):
+        """
+        Records the dependencies of output_path, along with a key hashed from
+        the strings in key_parts.
+        All dependencies must already be hashed with hash_input()
+        """
+        key = hash_bytes("\n".join(key_parts).encode())
+        self.outputs[str(output_path)] = (sorted(
+            str(x) for x in dependencies), key)
+
+    def is_fresh(self, output_path, previous):
+        """
+        Returns True if output_path was recorded identically in both this
+        manifest and the previous one, and none of its inputs changed.
+        """
+        output = str(output_path)
+        if output not in self.outputs or output not in previous.outputs:
+            return False
+        dependencies, key = self.outputs[output]
+        previous_dependencies, previous_key = previous.outputs[output]
+        if key != previous_key or dependencies != previous_dependencies:
+            return False
+        return all(
+            self.inputs.get(x) == previous.inputs.get(x)
+            for x in dependencies)
+
+    def orphans(self, previous):
+        """Returns the outputs of the previous manifest that are not in this one"""
+        return sorted(set(previous.outputs) - set(self.outputs))
@@ -2,15 +2,142 @@
 
 import configparser
 import datetime
+import hashlib
+import pickle
+import re
+import sys
+from pathlib import Path
+
+from . import _site_output
+
+
+# Same as configparser's section headers
+_SECTION_HEADER = re.compile(r'\[(?P<header>.+)\]')
+
+
+# Shared between all FileEntry objects
+_URL_PREFIXES = dict()
+_HASH_NAME_TUPLES = dict()
+
+
+def _intern_hash_names(hash_names):
+    hash_names = tuple(sys.intern(x) for x in hash_names)
+    return _HASH_NAME_TUPLES.setdefault(hash_names, hash_names)
+
+
+def _restore_file_entry(url_prefix, url_name, hash_names, hash_values):
+    """Unpickles a FileEntry, sharing its strings with existing entries"""
+    file_entry = FileEntry.__new__(FileEntry)
+    file_entry._url_prefix = _URL_PREFIXES.setdefault(url_prefix, url_prefix)
+    file_entry._url_name = url_name
+    file_entry._hash_names = _intern_hash_names(hash_names)
+    file_entry._hash_values = hash_values
+    return file_entry
+
+
+class FileEntry:
+    """
+    Compact representation of a file in a version INI
+
+    It behaves like the (url, dict of hash name to hash) tuple it replaces.
+    The directory part of the URL is shared with other files, hash names are
+    interned, and hexadecimal hashes are stored as bytes.
+    """
+
+    __slots__ = ('_url_prefix', '_url_name', '_hash_names', '_hash_values')
+
+    def __init__(self, url, hashes):
+        url_prefix, separator, self._url_name = url.rpartition('/')
+        url_prefix += separator
+        self._url_prefix = _URL_PREFIXES.setdefault(url_prefix, url_prefix)
+        self._hash_names = _intern_hash_names(hashes.keys())
+        self._hash_values = tuple(map(self._pack_hash, hashes.values()))
+
+    @staticmethod
+    def _pack_hash(hash_value):
+        try:
+            packed_hash = bytes.fromhex(hash_value)
+        except ValueError:
+            return hash_value
+        # Keep the original if it would not be reproduced exactly
+        if packed_hash.hex() != hash_value:
+            return hash_value
+        return packed_hash
+
+    @property
+    def url(self):
+        return self._url_prefix + self._url_name
+
+    @property
+    def hashes(self):
+        """dict of hash name to hexadecimal hash"""
+        return {
+            name: value.hex() if isinstance(value, bytes) else value
+            for name, value in zip(self._hash_names, self._hash_values)
+        }
+
+    def __iter__(self):
+        return iter((self.url, self.hashes))
+
+    def __getitem__(self, index):
+        return (self.url, self.hashes)[index]
+
+    def __len__(self):
+        return 2
+
+    def __eq__(self, other):
+        try:
+            return tuple(self) == tuple(other)
+        except TypeError:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash((self.url, self._hash_names, self._hash_values))
+
+    def __reduce__(self):
+        return (_restore_file_entry, (self._url_prefix, self._url_name,
+                                      self._hash_names, self._hash_values))
+
+    def __repr__(self):
+        return 'FileEntry({!r}, {!r})'.format(self.url, self.hashes)
+
+
+def _parse_metadata_section(metadata_section, metadata):
+    """
+    Parse the _metadata section of a version INI into the metadata dict
+    """
+    for config_attribute in metadata_section:
+        if config_attribute.lower() == "publication_time":
+            metadata['publication_time'] = datetime.datetime.strptime(
+                metadata_section[config_attribute],
+                "%Y-%m-%dT%H:%M:%S.%f").replace(tzinfo=datetime.timezone.utc)
+        elif config_attribute.lower() == "github_author":
+            metadata['github_author'] = metadata_section[config_attribute]
+        elif config_attribute.lower() == "install_info":
+            metadata['install_info'] = metadata_section[
+                config_attribute].strip()
+        elif config_attribute.lower() == "note":
+            metadata['note'] = metadata_section[config_attribute]
+        elif config_attribute.lower() == "status":
+            # Statuses are deprecated
+            pass
+        else:
+            raise ValueError(
+                "Unknown _metadata attribute '{}'".format(config_attribute))
+
+
+def _get_default_metadata():
+    return dict(
+        publication_time=None,
+        github_author=None,
+        install_info=None,
+        note='*(none)*')
 
 
 def parse_version_ini(ini_path):
     """Parse a version INI file"""
     files = dict()
-    publication_time = None
-    github_author = None
-    install_info = None
-    note = '*(none)*'
+    metadata = _get_default_metadata()
 
     version_config = configparser.ConfigParser()
     version_config.read(str(ini_path))
@@ -18,25 +145,7 @@ def parse_version_ini(ini_path):
         if section == "DEFAULT":
             continue
         elif section.lower() == "_metadata":
-            for config_attribute in version_config[section]:
-                if config_attribute.lower() == "publication_time":
-                    publication_time = datetime.datetime.strptime(
-                        version_config[section][config_attribute],
-                        "%Y-%m-%dT%H:%M:%S.%f").replace(
-                            tzinfo=datetime.timezone.utc)
-                elif config_attribute.lower() == "github_author":
-                    github_author = version_config[section][config_attribute]
-                elif config_attribute.lower() == "install_info":
-                    install_info = version_config[section][
-                        config_attribute].strip()
-                elif config_attribute.lower() == "note":
-                    note = version_config[section][config_attribute]
-                elif config_attribute.lower() == "status":
-                    # Statuses are deprecated
-                    pass
-                else:
-                    raise ValueError("Unknown _metadata attribute '{}'".format(
-                        config_attribute))
+            _parse_metadata_section(version_config[section], metadata)
         else:
             file_hashes = dict()
             url = None
@@ -49,5 +158,119 @@ def parse_version_ini(ini_path):
             if url is None:
                 raise ValueError("url is None. Section: {}, Path: {}".format(
                     section, str(ini_path)))
-            files[section] = (url, file_hashes)
-    return files, publication_time, github_author, install_info, note
+            files[section] = FileEntry(url, file_hashes)
+    return (files, metadata['publication_time'], metadata['github_author'],
+            metadata['install_info'], metadata['note'])
+
+
+def parse_version_metadata(ini_path):
+    """
+    Parse only the _metadata section of a version INI file
+
+    The other sections are only counted, so the number of files is returned
+    in place of the files themselves.
+    """
+    metadata = _get_default_metadata()
+    metadata_lines = list()
+    in_metadata = False
+    file_count = 0
+    with open(str(ini_path)) as ini_file:
+        for line in ini_file:
+            # configparser treats indented lines as value continuations
+            if line.startswith('['):
+                match = _SECTION_HEADER.match(line.strip())
+                if match:
+                    header = match.group('header')
+                    in_metadata = header.lower() == "_metadata"
+                    if not in_metadata and header != "DEFAULT":
+                        file_count += 1
+            if in_metadata:
+                metadata_lines.append(line)
+
+    version_config = configparser.ConfigParser()
+    version_config.read_string(''.join(metadata_lines), source=str(ini_path))
+    for section in version_config:
+        if section.lower() == "_metadata":
+            _parse_metadata_section(version_config[section], metadata)
+    return (file_count, metadata['publication_time'],
+            metadata['github_author'], metadata['install_info'],
+            metadata['note'])
+
+
+class ParsedConfigCache:
+    """
+    On-disk cache of parse_version_ini() results
+
+    Entries are keyed by the INI path and validated against the size and
+    modification time of the file. The whole cache is invalidated when this
+    module changes.
+    """
+
+    _FORMAT = 1
+
+    def __init__(self):
+        self._entries = dict()  # str path -> (size, mtime, parsed config)
+        self._modified = False
+
+    @staticmethod
+    def _get_parser_hash():
+        return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+    @classmethod
+    def load(cls, cache_path):
+        """Loads the cache at cache_path, or returns an empty cache"""
+        cache = cls()
+        try:
+            with cache_path.open('rb') as cache_file:
+                raw_cache = pickle.load(cache_file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+                ImportError):
+            return cache
+        if not isinstance(raw_cache, dict):
+            return cache
+        if raw_cache.get('format') != cls._FORMAT:
+            return cache
+        if raw_cache.get('parser') != cls._get_parser_hash():
+            return cache
+        cache._entries = raw_cache['entries']
+        return cache
+
+    def save(self, cache_path):
+        """Atomically writes the cache to cache_path if it was modified"""
+        if not self._modified:
+            return
+        raw_cache = {
+            'format': self._FORMAT,
+            'parser': self._get_parser_hash(),
+            'entries': self._entries,
+        }
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        _site_output.replace_file_if_changed(
+            cache_path, pickle.dumps(raw_cache,
+                                     protocol=pickle.HIGHEST_PROTOCOL))
+        self._modified = False
+
+    def get(self, ini_path):
+        """Returns the cached result for ini_path, or None if it is stale"""
+        cached = self._entries.get(str(ini_path))
+        if cached is None:
+            return None
+        size, mtime, parsed_config = cached
+        ini_stat = ini_path.stat()
+        if ini_stat.st_size != size or ini_stat.st_mtime_ns != mtime:
+            return None
+        return parsed_config
+
+    def put(self, ini_path, parsed_config):
+        """Stores the result of parsing ini_path"""
+        ini_stat = ini_path.stat()
+        self._entries[str(ini_path)] = (ini_stat.st_size, ini_stat.st_mtime_ns,
+                                        parsed_config)
+        self._modified = True
+
+    def prune(self, ini_paths):
+        """Removes entries for INIs that are not in ini_paths"""
+        keep = set(map(str, ini_paths))
+        for stale_path in set(self._entries) - keep:
+            del self._entries[stale_path]
+            self._modified = True
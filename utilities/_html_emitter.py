@@ -0,0 +1,121 @@
+# Direct HTML emitter for the machine-generated parts of pages
+#
+# The functions here produce the same HTML that Python-Markdown produces for
+# the equivalent Markdown built by site_generator, without parsing it.
+
+import re
+
+# Must not contain anything that Markdown would transform
+_PLACEHOLDER = "ungooghtmlfragment{}x"
+
+# Markdown syntax that may occur in link text: backslash escapes, code spans,
+# emphasis, brackets, raw HTML, table cell separators, character references,
+# and underscores that are not inside a word
+_TEXT_SYNTAX = re.compile(r"[\\`*\[\]<>|]|&#?\w+;|(?<!\w)_|_(?!\w)")
+
+# Markdown syntax that may occur in the URL of an inline link
+_URL_SYNTAX = re.compile(r"[\s\\`<>\"'()]|&#?\w+;")
+
+
+def escape_text(text):
+    """Escapes text for use in HTML element content"""
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def escape_attribute(value):
+    """Escapes value for use in a double-quoted HTML attribute"""
+    return escape_text(value).replace('"', "&quot;")
+
+
+def is_literal_text(text):
+    """
+    Returns True if Markdown would output text as is (apart from escaping it),
+    so that the functions here produce the same HTML as Markdown for it
+    """
+    return _TEXT_SYNTAX.search(text) is None
+
+
+def is_literal_link(text, url):
+    """Returns True if link() is equivalent to [text](url) for text and url"""
+    return is_literal_text(text) and _URL_SYNTAX.search(url) is None
+
+
+def link(text, url):
+    """Equivalent of [text](url)"""
+    return '<a href="{}">{}</a>'.format(escape_attribute(url), escape_text(text))
+
+
+def code(text):
+    """Equivalent of `text`"""
+    return "<code>{}</code>".format(escape_text(text))
+
+
+def strong(content_html):
+    """Equivalent of **content**"""
+    return "<strong>{}</strong>".format(content_html)
+
+
+def bullet_list(items):
+    """
+    Equivalent of a Markdown bullet list
+
+    items is an iterable of (item HTML, nested bullet list HTML or None)
+    """
+    list_items = list()
+    for item_html, nested_html in items:
+        if nested_html:
+            list_items.append("<li>{}{}\n</li>".format(item_html, nested_html))
+        else:
+            list_items.append("<li>{}</li>".format(item_html))
+    return "<ul>\n{}\n</ul>".format("\n".join(list_items))
+
+
+def left_aligned_table(header, rows):
+    """
+    Equivalent of a Markdown table with all columns left-aligned
+
+    header is a sequence of cell HTML, and rows a sequence of such sequences.
+    """
+    cell_template = '<{tag} style="text-align: left;">{content}</{tag}>'
+
+    def _row(tag, cells):
+        return "<tr>\n{}\n</tr>".format("\n".join(
+            cell_template.format(tag=tag, content=x) for x in cells))
+
+    return "<table>\n<thead>\n{}\n</thead>\n<tbody>\n{}\n</tbody>\n</table>".format(
+        _row("th", header), "\n".join(_row("td", x) for x in rows))
+
+
+class HtmlFragments:
+    """
+    HTML fragments of a page that bypass the Markdown conversion
+
+    Each fragment is referenced from the Markdown content of the page by a
+    placeholder, which is replaced by the fragment after the conversion.
+    """
+
+    def __init__(self):
+        self._fragments = list()  # (placeholder, is_block, HTML)
+
+    def _add(self, is_block, fragment_html):
+        placeholder = _PLACEHOLDER.format(len(self._fragments))
+        self._fragments.append((placeholder, is_block, fragment_html))
+        return placeholder
+
+    def inline(self, fragment_html):
+        """Returns the Markdown placeholder for an inline fragment"""
+        return self._add(False, fragment_html)
+
+    def block(self, fragment_html):
+        """Returns the Markdown placeholder for a block-level fragment"""
+        return self._add(True, fragment_html) + "\n"
+
+    def substitute(self, page_html):
+        """Replaces the placeholders in the converted page_html"""
+        for placeholder, is_block, fragment_html in self._fragments:
+            paragraph = "<p>{}</p>".format(placeholder)
+            if is_block and paragraph in page_html:
+                page_html = page_html.replace(paragraph, fragment_html)
+            else:
+                page_html = page_html.replace(placeholder, fragment_html)
+        return page_html
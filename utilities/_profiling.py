@@ -0,0 +1,74 @@
+# Build profiling for the site generator
+
+import contextlib
+import json
+import time
+
+
+class BuildProfiler:
+    """
+    Collects the time spent in each phase of a build, and the render time
+    and output size of each page.
+    """
+
+    def __init__(self):
+        self.phases = dict()  # phase name -> seconds, in order of first use
+        self.pages = list()  # (output path, render seconds, output bytes)
+        self._start_time = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager that adds the time spent inside it to phase name"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_time)
+
+    def add_time(self, name, seconds):
+        """Adds seconds to phase name"""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def record_page(self, output_path, render_seconds, output_size):
+        """Records the render time and size of a page"""
+        self.pages.append((str(output_path), render_seconds, output_size))
+
+    def get_report(self):
+        """Returns the profile as a JSON-serializable dict"""
+        return {
+            'total_seconds': time.perf_counter() - self._start_time,
+            'phases': self.phases,
+            'pages': [{
+                'path': path,
+                'render_seconds': render_seconds,
+                'size': output_size,
+            } for path, render_seconds, output_size in self.pages],
+        }
+
+    def write_report(self, report_path):
+        """Writes the profile as JSON to report_path"""
+        with report_path.open('w') as report_file:
+            json.dump(self.get_report(), report_file, indent=1)
+
+    def print_summary(self, top_count):
+        """Prints the time of each phase and the top_count slowest pages"""
+        report = self.get_report()
+        print('Total build time: {:.3f}s'.format(report['total_seconds']))
+        for name, seconds in self.phases.items():
+            print('    {:<28}{:9.3f}s'.format(name, seconds))
+        if not self.pages:
+            return
+        total_size = sum(x[2] for x in self.pages)
+        print('Rendered {} pages ({} bytes)'.format(len(self.pages), total_size))
+        print('Slowest pages:')
+        for path, render_seconds, output_size in sorted(
+                self.pages, key=lambda x: x[1], reverse=True)[:top_count]:
+            print('    {:9.2f}ms {:>9} bytes  {}'.format(
+                render_seconds * 1000, output_size, path))
+
+
+def phase(profiler, name):
+    """Returns profiler.phase(name), or a no-op context if profiler is None"""
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.phase(name)
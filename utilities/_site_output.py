@@ -0,0 +1,280 @@
+# Writing of generated site files
+
+import ctypes
+import errno
+import filecmp
+import gzip
+import io
+import os
+import shutil
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content-Encoding -> suffix of the precompressed variant of a file
+COMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# From the Linux headers, for renameat2()
+_AT_FDCWD = -100
+_RENAME_EXCHANGE = 2
+
+try:
+    _RENAMEAT2 = ctypes.CDLL(None, use_errno=True).renameat2
+except (OSError, AttributeError, TypeError):
+    # Not Linux, or a C library older than glibc 2.28
+    _RENAMEAT2 = None
+
+
+def replace_file_if_changed(target_path, data):
+    """
+    Atomically replaces target_path with data, unless it already contains it.
+    Returns True if the file was written.
+    """
+    try:
+        if target_path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    file_descriptor, temp_path = tempfile.mkstemp(
+        dir=str(target_path.parent), prefix='.' + target_path.name + '.')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, str(target_path))
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return True
+
+
+def write_temp_file(target_path, write_function):
+    """
+    Calls write_function with a UTF-8 text file in a new temporary file
+    beside target_path, and returns the path of the temporary file.
+    """
+    file_descriptor, temp_path = tempfile.mkstemp(
+        dir=str(target_path.parent), prefix='.' + target_path.name + '.')
+    try:
+        with io.open(
+                file_descriptor, 'w', encoding='UTF-8',
+                newline='') as temp_file:
+            write_function(temp_file)
+        os.chmod(temp_path, 0o644)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return temp_path
+
+
+def replace_file_with_temp_if_changed(target_path, temp_path):
+    """
+    Atomically replaces target_path with the file at temp_path, unless their
+    contents are the same. The temporary file is removed either way.
+    Returns True if target_path was replaced.
+    """
+    try:
+        unchanged = filecmp.cmp(temp_path, str(target_path), shallow=False)
+    except FileNotFoundError:
+        unchanged = False
+    if unchanged:
+        os.unlink(temp_path)
+        return False
+    os.replace(temp_path, str(target_path))
+    return True
+
+
+def is_encoding_available(encoding):
+    """Returns True if files can be precompressed with encoding"""
+    if encoding == 'br':
+        return brotli is not None
+    return encoding in COMPRESSED_SUFFIXES
+
+
+def get_compressed_path(path, encoding):
+    """Returns the path of the variant of path compressed with encoding"""
+    return path.with_name(path.name + COMPRESSED_SUFFIXES[encoding])
+
+
+def compress(data, encoding):
+    """
+    Returns data compressed with encoding.
+    The same data always gives the same output.
+    """
+    if encoding == 'gzip':
+        compressed_data = io.BytesIO()
+        # A fixed mtime and no file name keep the output reproducible
+        with gzip.GzipFile(
+                filename='',
+                mode='wb',
+                compresslevel=9,
+                fileobj=compressed_data,
+                mtime=0) as gzip_file:
+            gzip_file.write(data)
+        return compressed_data.getvalue()
+    if encoding == 'br':
+        if brotli is None:
+            raise RuntimeError('The brotli module is not installed')
+        return brotli.compress(data)
+    raise ValueError('Unknown encoding: {}'.format(encoding))
+
+
+def write_compressed_file(source_path, encoding):
+    """
+    Writes the variant of source_path compressed with encoding beside it.
+    Returns True if the file was written.
+    """
+    return replace_file_if_changed(
+        get_compressed_path(source_path, encoding),
+        compress(source_path.read_bytes(), encoding))
+
+
+def exchange_paths(first_path, second_path):
+    """
+    Atomically exchanges two existing paths, so that each is always present.
+    Returns False if the system or file system cannot do it.
+    """
+    if _RENAMEAT2 is None:
+        return False
+    result = _RENAMEAT2(_AT_FDCWD, os.fsencode(str(first_path)), _AT_FDCWD,
+                        os.fsencode(str(second_path)), _RENAME_EXCHANGE)
+    if result == 0:
+        return True
+    error = ctypes.get_errno()
+    if error in (errno.ENOSYS, errno.EINVAL, errno.ENOTSUP):
+        return False
+    raise OSError(error, os.strerror(error), str(first_path))
+
+
+def _link_or_copy(source_path, target_path):
+    """Hard-links source_path to target_path, or copies it with its mtime"""
+    try:
+        os.link(str(source_path), str(target_path))
+    except OSError:
+        shutil.copy2(str(source_path), str(target_path))
+
+
+class StagedOutput:
+    """
+    Builds a new version of an output directory in a staging directory
+    beside it, and swaps it into place once complete.
+
+    Files whose contents did not change are hard-linked from the current
+    directory instead of being written, so they keep their modification
+    times. Files that are not written or kept are dropped by the swap.
+
+    The swap is atomic where exchange_paths() works (Linux 3.15 and most of
+    its file systems). Elsewhere, the target directory briefly does not
+    exist between two renames.
+    """
+
+    def __init__(self, target_dir):
+        self.target_dir = target_dir
+        self.staging_dir = target_dir.with_name(target_dir.name + '.staging')
+        self._old_dir = target_dir.with_name(target_dir.name + '.old')
+        self.changed_count = 0
+        self.unchanged_count = 0
+
+    def begin(self):
+        """Prepares an empty staging directory"""
+        if self._old_dir.exists():
+            if not self.target_dir.exists():
+                # A previous swap was interrupted; restore the old output
+                self._old_dir.rename(self.target_dir)
+            else:
+                shutil.rmtree(str(self._old_dir))
+        if self.staging_dir.exists():
+            shutil.rmtree(str(self.staging_dir))
+        self.staging_dir.mkdir()
+
+    def mkdir(self, relative_path):
+        """Creates a directory in the staging directory"""
+        (self.staging_dir / relative_path).mkdir(exist_ok=True)
+
+    def write(self, relative_path, data):
+        """
+        Stages a file with the given bytes.
+        Returns True if it differs from the current file.
+        """
+        current_path = self.target_dir / relative_path
+        staged_path = self.staging_dir / relative_path
+        try:
+            unchanged = current_path.read_bytes() == data
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            unchanged = False
+        if unchanged:
+            _link_or_copy(current_path, staged_path)
+            self.unchanged_count += 1
+            return False
+        staged_path.write_bytes(data)
+        self.changed_count += 1
+        return True
+
+    def write_stream(self, relative_path, write_function):
+        """
+        Stages a file written by write_function to a UTF-8 text file object,
+        without holding its contents in memory.
+        Returns True if it differs from the current file.
+        """
+        current_path = self.target_dir / relative_path
+        staged_path = self.staging_dir / relative_path
+        with staged_path.open('w', encoding='UTF-8', newline='') as staged_file:
+            write_function(staged_file)
+        try:
+            unchanged = filecmp.cmp(
+                str(staged_path), str(current_path), shallow=False)
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            unchanged = False
+        if unchanged:
+            staged_path.unlink()
+            _link_or_copy(current_path, staged_path)
+            self.unchanged_count += 1
+            return False
+        self.changed_count += 1
+        return True
+
+    def has_current(self, relative_path):
+        """Returns True if relative_path exists in the current directory"""
+        return (self.target_dir / relative_path).is_file()
+
+    def keep(self, relative_path):
+        """Stages the current version of a file without reading it"""
+        _link_or_copy(self.target_dir / relative_path,
+                      self.staging_dir / relative_path)
+        self.unchanged_count += 1
+
+    def commit(self):
+        """Swaps the staging directory into place of the target directory"""
+        if self.target_dir.exists():
+            if exchange_paths(self.staging_dir, self.target_dir):
+                # The staging directory now holds the previous output
+                shutil.rmtree(str(self.staging_dir))
+                return
+            self.target_dir.rename(self._old_dir)
+            self.staging_dir.rename(self.target_dir)
+            shutil.rmtree(str(self._old_dir))
+        else:
+            self.staging_dir.rename(self.target_dir)
+
+    def abort(self):
+        """Discards the staging directory"""
+        if self.staging_dir.exists():
+            shutil.rmtree(str(self.staging_dir))
+
+
+class MemoryOutput:
+    """
+    Files of a website generated into memory instead of the disk
+
+    files maps the POSIX path of each file, relative to the repository root,
+    to its contents. It is replaced as a whole by each build, so that readers
+    in other threads always see a complete build. manifest is the
+    BuildManifest of that build.
+    """
+
+    def __init__(self):
+        self.files = dict()
+        self.manifest = None
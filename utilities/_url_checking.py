@@ -0,0 +1,427 @@
+# Concurrent checking of download URLs
+
+import collections
+import concurrent.futures
+import datetime
+import email.utils
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+import requests.adapters
+
+from . import _site_output
+
+# Responses up to this size are read, so that their connection can be reused
+_MAX_DRAINED_SIZE = 64 * 1024
+
+# Statuses of responses that are worth retrying
+_RETRIED_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+# Exceptions of requests that are worth retrying
+_RETRIED_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+
+class UrlCheckResult(
+        collections.namedtuple('UrlCheckResult',
+                               ('url', 'status', 'reason', 'final_url',
+                                'content_length', 'error', 'checked_at',
+                                'retries'),
+                               defaults=(0, ))):
+    """
+    Result of checking a URL
+
+    status and reason are those of the final response after redirects. If no
+    response was received, they are None and error describes why.
+    content_length is the size of the file, if the server reported it.
+    checked_at is the time of the check, in seconds since the epoch.
+    retries is the number of times the request was retried before this result.
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.status is not None and self.status < 400
+
+    def describe(self):
+        """Returns a short description of the outcome"""
+        if self.status is None:
+            description = self.error
+        else:
+            description = 'Got {} ({})'.format(self.status, self.reason)
+        if self.retries:
+            description += ' after {} retries'.format(self.retries)
+        return description
+
+
+def _get_content_length(response):
+    """Returns the size of the whole file a (possibly ranged) response is of"""
+    content_range = response.headers.get('Content-Range', '')
+    _, _, total_length = content_range.rpartition('/')
+    if total_length.isdigit():
+        return int(total_length)
+    content_length = response.headers.get('Content-Length', '')
+    if content_length.isdigit():
+        return int(content_length)
+    return None
+
+
+def _get_retry_after(response):
+    """
+    Returns the delay in seconds asked for by the Retry-After header of
+    response, or None if it has none
+    """
+    retry_after = response.headers.get('Retry-After', '').strip()
+    if not retry_after:
+        return None
+    if retry_after.isdigit():
+        return float(retry_after)
+    try:
+        retry_time = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_time.tzinfo is None:
+        # HTTP dates are always in GMT
+        retry_time = retry_time.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, retry_time.timestamp() - time.time())
+
+
+def _release_response(response):
+    """Returns the connection of response to its pool when it is cheap to"""
+    content_length = response.headers.get('Content-Length', '')
+    if content_length.isdigit() and int(content_length) <= _MAX_DRAINED_SIZE:
+        try:
+            response.content  # pylint: disable=pointless-statement
+        except requests.RequestException:
+            pass
+    response.close()
+
+
+class _HostLimit:
+    """
+    Adaptive limit of the concurrent requests to a host
+
+    The limit starts at max_requests. When the host throttles a request, the
+    limit is halved and no new requests are started until the delay it asked
+    for has passed. Each request that is not throttled raises the limit by
+    1 / limit, i.e. by about one for a full round of requests.
+
+    Once the threading.Event stopping is set and wake() called, requests no
+    longer wait for the limit.
+    """
+
+    def __init__(self, max_requests, stopping):
+        self.max_requests = max_requests
+        self.limit = float(max_requests)
+        self._active = 0
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+        self._stopping = stopping
+
+    def __enter__(self):
+        with self._condition:
+            while not self._stopping.is_set():
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._condition.wait(pause)
+                elif self._active >= int(self.limit):
+                    self._condition.wait()
+                else:
+                    break
+            self._active += 1
+
+    def __exit__(self, *exc_info):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def wake(self):
+        """Wakes up the requests waiting for the limit"""
+        with self._condition:
+            self._condition.notify_all()
+
+    def succeed(self):
+        """Records a request that was not throttled"""
+        with self._condition:
+            if self.limit < self.max_requests:
+                self.limit = min(self.max_requests, self.limit + 1 / self.limit)
+                self._condition.notify_all()
+
+    def throttle(self, delay):
+        """Records a throttled request, and pauses the host for delay seconds"""
+        with self._condition:
+            now = time.monotonic()
+            # Requests throttled during the same pause only count once
+            if now >= self._paused_until:
+                self.limit = max(1.0, self.limit / 2)
+            self._paused_until = max(self._paused_until, now + delay)
+
+
+class UrlChecker:
+    """
+    Checks URLs concurrently with a pool of max_workers threads.
+
+    At most max_per_host requests are made to the same host at once, fewer
+    while the host throttles them. Each thread keeps its own requests.Session,
+    so connections are reused across the URLs it checks. timeout is the
+    connect and read timeout of each request, in seconds.
+
+    Throttled requests (429), server errors and failed connections are retried
+    up to retries times. Each retry waits for the delay in the Retry-After
+    header of the response, or else for an exponential backoff with jitter
+    starting at backoff seconds. Delays are capped at max_delay seconds.
+
+    Only the first two bytes of each file are requested.
+    """
+
+    def __init__(self,
+                 max_workers=16,
+                 max_per_host=4,
+                 timeout=30,
+                 retries=4,
+                 backoff=1.0,
+                 max_delay=60):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self._local = threading.local()
+        self._sessions = list()
+        self._host_limits = dict()
+        self._lock = threading.Lock()
+        # Set to make the checks in progress return as soon as possible
+        self._stopping = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Closes the sessions of all threads"""
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+
+    def _get_session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=self.max_per_host)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _get_host_limit(self, url):
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._lock:
+            host_limit = self._host_limits.get(host)
+            if host_limit is None:
+                host_limit = _HostLimit(self.max_per_host, self._stopping)
+                self._host_limits[host] = host_limit
+        return host_limit
+
+    def _get_backoff(self, retries):
+        """Returns the delay before retry number retries + 1, with jitter"""
+        delay = min(self.max_delay, self.backoff * 2**retries)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _stop(self):
+        """Makes the checks in progress return without further requests"""
+        self._stopping.set()
+        with self._lock:
+            host_limits = list(self._host_limits.values())
+        for host_limit in host_limits:
+            host_limit.wake()
+
+    def _request(self, url, retries):
+        """
+        Requests url once.
+        Returns its UrlCheckResult, whether it is worth retrying, and the
+        delay asked for by the server (or None).
+        """
+        try:
+            response = self._get_session().get(
+                url,
+                allow_redirects=True,
+                headers={'Range': 'bytes=0-1'},
+                timeout=self.timeout,
+                stream=True)
+        except requests.RequestException as exc:
+            return (UrlCheckResult(url, None, None, None, None,
+                                   '{}: {}'.format(type(exc).__name__, exc),
+                                   time.time(), retries),
+                    isinstance(exc, _RETRIED_EXCEPTIONS), None)
+        try:
+            return (UrlCheckResult(url, response.status_code, response.reason,
+                                   response.url, _get_content_length(response),
+                                   None, time.time(), retries),
+                    response.status_code in _RETRIED_STATUSES,
+                    _get_retry_after(response))
+        finally:
+            _release_response(response)
+
+    def check(self, url):
+        """Checks a single URL, and returns its UrlCheckResult"""
+        host_limit = self._get_host_limit(url)
+        retries = 0
+        while True:
+            with host_limit:
+                if self._stopping.is_set():
+                    return UrlCheckResult(url, None, None, None, None,
+                                          'Interrupted', time.time(), retries)
+                result, retryable, retry_after = self._request(url, retries)
+                if not retryable:
+                    host_limit.succeed()
+                    return result
+                delay = self._get_backoff(retries)
+                if retry_after is not None:
+                    delay = min(self.max_delay, retry_after)
+                if result.status == 429 or retry_after is not None:
+                    # Pause the host before giving back the slot, so that no
+                    # request waiting for it is started in the meantime
+                    host_limit.throttle(delay)
+            if retries >= self.retries:
+                return result
+            # Wait outside of the host limit, so other URLs can be checked
+            if self._stopping.wait(delay):
+                return result
+            retries += 1
+
+    def check_all(self, urls, progress=None, cache=None, refresh=False):
+        """
+        Checks the URLs in urls concurrently, each only once.
+        Returns a dict of URL to UrlCheckResult.
+
+        If progress is given, it is called with each UrlCheckResult as soon
+        as it is available.
+        If cache is a UrlCheckCache, URLs with a fresh result in it are not
+        checked again, and new results are added to it. With refresh, every
+        URL is checked and its cached result replaced.
+        """
+        self._stopping.clear()
+        results = dict()
+        unchecked_urls = list()
+        for url in dict.fromkeys(urls):
+            result = None
+            if cache is not None and not refresh:
+                result = cache.get(url)
+            if result is None:
+                unchecked_urls.append(url)
+                continue
+            results[url] = result
+            if progress is not None:
+                progress(result)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self.check, url) for url in unchecked_urls
+            ]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    result = future.result()
+                    results[result.url] = result
+                    if cache is not None:
+                        cache.put(result)
+                    if progress is not None:
+                        progress(result)
+            except BaseException:
+                # Only wait for the requests in progress when interrupted,
+                # not for queued checks, retry delays or throttled hosts
+                for future in futures:
+                    future.cancel()
+                self._stop()
+                raise
+        return results
+
+
+class UrlCheckCache:
+    """
+    On-disk cache of successful UrlCheckResults
+
+    Each entry stays fresh for ttl seconds after its URL was checked. Failed
+    checks are not cached, so they are always retried.
+    """
+
+    _FORMAT = 1
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        # URL -> [status, reason, final URL, content length, checked at]
+        self._entries = dict()
+        self._modified = False
+
+    @classmethod
+    def load(cls, cache_path, ttl):
+        """Loads the cache at cache_path, or returns an empty cache"""
+        cache = cls(ttl)
+        try:
+            with cache_path.open() as cache_file:
+                raw_cache = json.load(cache_file)
+        except (OSError, ValueError):
+            return cache
+        if not isinstance(raw_cache, dict):
+            return cache
+        if raw_cache.get('format') != cls._FORMAT:
+            return cache
+        cache._entries = raw_cache['entries']
+        return cache
+
+    def save(self, cache_path):
+        """
+        Atomically writes the cache to cache_path if it was modified.
+        Expired entries are dropped.
+        """
+        if not self._modified:
+            return
+        now = time.time()
+        raw_cache = {
+            'format': self._FORMAT,
+            'entries': {
+                url: entry
+                for url, entry in self._entries.items()
+                if self._is_fresh(entry, now)
+            },
+        }
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        _site_output.replace_file_if_changed(
+            cache_path,
+            json.dumps(raw_cache, sort_keys=True).encode())
+        self._modified = False
+
+    def _is_fresh(self, entry, now):
+        return 0 <= now - entry[-1] < self.ttl
+
+    def get(self, url):
+        """Returns the cached result for url, or None if it is stale"""
+        entry = self._entries.get(url)
+        if entry is None or not self._is_fresh(entry, time.time()):
+            return None
+        status, reason, final_url, content_length, checked_at = entry
+        return UrlCheckResult(url, status, reason, final_url, content_length,
+                              None, checked_at)
+
+    def put(self, result):
+        """Caches result if the check succeeded"""
+        if not result.ok:
+            # Forget the previous success, if any
+            if self._entries.pop(result.url, None) is not None:
+                self._modified = True
+            return
+        self._entries[result.url] = [
+            result.status, result.reason, result.final_url,
+            result.content_length, result.checked_at
+        ]
+        self._modified = True
@@ -0,0 +1,101 @@
+# Ordered index of the versions in a platform directory
+
+import bisect
+import re
+
+from packaging.version import Version
+
+
+def version_sort_key(version):
+    """
+    Returns the sorting key for a version string (an INI file stem)
+
+    Letters are dropped and dashes become dots so that versions like
+    84.0.4147.135-1.musl1 can be compared by packaging. The full version
+    string breaks ties between versions that only differ in what was dropped.
+    """
+    version_without_dashes = version.replace("-", ".")
+    version_without_characters = re.sub(r'[a-zA-Z]', '', version_without_dashes)
+    return (Version(version_without_characters), version)
+
+
+class _AfterAnyVersion:
+    """Tiebreak that sorts after every version string"""
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+
+_AFTER_ANY_VERSION = _AfterAnyVersion()
+
+
+class VersionIndex:
+    """
+    The versions of a platform directory, ordered by their sort_key
+
+    Iterating and indexing yield the latest version first. New versions are
+    inserted in O(log n) comparisons, and latest() and between() do not sort.
+    """
+
+    __slots__ = ('_keys', '_versions')
+
+    def __init__(self, versions=()):
+        # Both lists are in ascending order of sort keys
+        self._keys = list()
+        self._versions = list()
+        for version in versions:
+            self.insert(version)
+
+    def insert(self, version):
+        """Inserts a version, which must have a sort_key attribute"""
+        position = bisect.bisect_right(self._keys, version.sort_key)
+        self._keys.insert(position, version.sort_key)
+        self._versions.insert(position, version)
+
+    def remove(self, version):
+        """Removes a version from the index"""
+        position = bisect.bisect_left(self._keys, version.sort_key)
+        if (position == len(self._versions)
+                or self._versions[position] is not version):
+            raise ValueError("{!r} is not in the index".format(version))
+        del self._keys[position]
+        del self._versions[position]
+
+    def latest(self):
+        """Returns the latest version, or None if the index is empty"""
+        if not self._versions:
+            return None
+        return self._versions[-1]
+
+    def between(self, minimum=None, maximum=None):
+        """
+        Returns the versions between the version strings minimum and maximum
+        (inclusive, ignoring the tiebreak), latest first.
+        None leaves that end of the range open.
+        """
+        start = 0
+        end = len(self._keys)
+        if minimum is not None:
+            # A tuple of only the Version sorts before any key with it
+            start = bisect.bisect_left(self._keys,
+                                       (version_sort_key(minimum)[0], ))
+        if maximum is not None:
+            end = bisect.bisect_right(
+                self._keys, (version_sort_key(maximum)[0], _AFTER_ANY_VERSION))
+        return self._versions[start:end][::-1]
+
+    def __len__(self):
+        return len(self._versions)
+
+    def __iter__(self):
+        return reversed(self._versions)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._versions)
+        if not 0 <= index < len(self._versions):
+            raise IndexError("version index out of range")
+        return self._versions[len(self._versions) - 1 - index]
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2026 The ungoogled-chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+'''
+Benchmarks the site generator against a synthetic platform tree
+
+A config/platforms tree of the requested shape is generated in a temporary
+directory, and the time taken by read_config, write_website (full and
+incremental) and feed generation is measured, along with the peak memory
+used by a full build. The serialization of a large standalone Atom feed is
+also measured. Everything runs offline.
+'''
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import os.path
+import pathlib
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+if __name__ == "__main__" and (__package__ is None or __package__ == ""):
+
+    def _fix_relative_import():
+        """Allow relative imports to work from anywhere"""
+        parent_path = os.path.dirname(
+            os.path.realpath(os.path.abspath(__file__)))
+        sys.path.insert(0, os.path.dirname(parent_path))
+        global __package__  #pylint: disable=global-variable-undefined
+        __package__ = os.path.basename(parent_path)  #pylint: disable=redefined-builtin
+        __import__(__package__)
+        sys.path.pop(0)
+
+    _fix_relative_import()
+
+from . import pyatom  # pylint: disable=wrong-import-position
+from . import site_generator  # pylint: disable=wrong-import-position
+
+_REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+_HASH_LENGTHS = (('md5', 32), ('sha1', 40), ('sha256', 64))
+
+
+def _write_display_name(dir_path, display_name):
+    dir_path.mkdir(parents=True, exist_ok=True)
+    (dir_path / 'display_name').write_text(display_name + '\n')
+
+
+def _get_ini(rng, version, file_count):
+    """Returns the contents of a version INI like submit_github_binary.py"""
+    publication_time = datetime.datetime(2020, 1, 1) + datetime.timedelta(
+        seconds=rng.randrange(5 * 365 * 24 * 3600))
+    sections = [
+        '[_metadata]\npublication_time = {}\ngithub_author = {}'.format(
+            publication_time.isoformat(timespec='microseconds'),
+            'user{}'.format(rng.randrange(50)))
+    ]
+    for file_index in range(file_count):
+        filename = 'ungoogled-chromium_{}_{}.tar.xz'.format(
+            version, file_index)
+        hashes = '\n'.join('{} = {:0{}x}'.format(name, rng.getrandbits(
+            length * 4), length) for name, length in _HASH_LENGTHS)
+        sections.append(
+            '[{filename}]\nurl = https://github.com/user/'
+            'ungoogled-chromium-binaries/releases/download/{version}/'
+            '{filename}\n{hashes}'.format(
+                filename=filename, version=version, hashes=hashes))
+    return '\n\n'.join(sections) + '\n'
+
+
+def generate_tree(root, platforms, depth, branching, versions, files, seed):
+    """
+    Generates config/ under root with the given shape.
+    Returns the number of version INIs written.
+    """
+    rng = random.Random(seed)
+    shutil.copytree(
+        str(_REPO_ROOT / 'config' / 'page_templates'),
+        str(root / 'config' / 'page_templates'))
+    platforms_root = root / 'config' / 'platforms'
+    _write_display_name(platforms_root, 'Releases')
+    leaves = list()
+    for platform_index in range(platforms):
+        platform_path = platforms_root / 'platform{}'.format(platform_index)
+        _write_display_name(platform_path, 'Platform {}'.format(platform_index))
+        level = [platform_path]
+        for _ in range(depth):
+            next_level = list()
+            for dir_path in level:
+                for branch_index in range(branching):
+                    child_path = dir_path / 'variant{}'.format(branch_index)
+                    _write_display_name(child_path,
+                                        'Variant {}'.format(branch_index))
+                    next_level.append(child_path)
+            level = next_level
+        leaves.extend(level)
+    ini_count = 0
+    for leaf_path in leaves:
+        for version_index in range(versions):
+            version = '{}.0.{}.{}-1'.format(80 + version_index // 10,
+                                           4000 + version_index,
+                                           rng.randrange(300))
+            (leaf_path / (version + '.ini')).write_text(
+                _get_ini(rng, version, files))
+            ini_count += 1
+    return ini_count
+
+
+def _time_call(repeat, function, *args, **kwargs):
+    """Returns the fastest of repeat calls to function, in seconds"""
+    timings = list()
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start_time = time.perf_counter()
+            function(*args, **kwargs)
+            timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+
+def _get_large_feed(entry_count, seed):
+    """Returns an AtomFeed with entry_count entries like the site's feed"""
+    rng = random.Random(seed)
+    feed = pyatom.AtomFeed(
+        title='Feed serialization benchmark',
+        feed_url='https://example.org/feed.xml',
+        url='https://example.org/')
+    for entry_index in range(entry_count):
+        version = '{}.0.{}.{}-1'.format(80 + entry_index % 70, entry_index,
+                                       rng.randrange(300))
+        publication_time = datetime.datetime(
+            2020, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(
+                seconds=rng.randrange(5 * 365 * 24 * 3600))
+        feed.add(
+            title='Platform {} & variant: {}'.format(entry_index % 20,
+                                                     version),
+            content='<h2>Release Summary</h2>\n<p>\n<div>Author: user{}'
+            '</div>\n</p>'.format(rng.randrange(50)),
+            content_type='html',
+            updated=publication_time,
+            url='https://example.org/releases/platform/{}'.format(version),
+            id=publication_time.isoformat() + version)
+    return feed
+
+
+def _time_feed_serialization(repeat, entry_count, seed):
+    """Returns the fastest time to write a feed of entry_count entries"""
+    feed = _get_large_feed(entry_count, seed)
+    return _time_call(repeat, lambda: feed.write_to(io.StringIO()))
+
+
+def _get_peak_memory(args, feed_path):
+    """Returns the peak memory traced during a full build, in bytes"""
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            root_dir = site_generator.read_config(jobs=args.jobs)
+            site_generator.write_website(
+                root_dir, feed_path, jobs=args.jobs, backend=args.backend)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _get_git_revision():
+    try:
+        return subprocess.run(('git', 'rev-parse', '--short', 'HEAD'),
+                              capture_output=True,
+                              check=True,
+                              text=True,
+                              cwd=str(_REPO_ROOT)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(args, work_dir):
+    """Runs the benchmark inside work_dir and returns the results"""
+    ini_count = generate_tree(work_dir, args.platforms, args.depth,
+                              args.branching, args.versions, args.files,
+                              args.seed)
+    feed_path = work_dir / 'feed.xml'
+    # site_generator works relative to the repository root
+    os.chdir(str(work_dir))
+    timings = dict()
+    timings['read_config'] = _time_call(
+        args.repeat, site_generator.read_config, jobs=args.jobs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        root_dir = site_generator.read_config(jobs=args.jobs)
+    timings['write_website'] = _time_call(
+        args.repeat,
+        site_generator.write_website,
+        root_dir,
+        feed_path,
+        jobs=args.jobs,
+        backend=args.backend)
+    timings['write_website_incremental'] = _time_call(
+        args.repeat,
+        site_generator.write_website,
+        root_dir,
+        feed_path,
+        incremental=True,
+        jobs=args.jobs,
+        backend=args.backend)
+    timings['feed_generation'] = _time_call(
+        args.repeat, lambda: site_generator.get_feed(root_dir).to_string())
+    if args.feed_entries:
+        timings['feed_serialization'] = _time_feed_serialization(
+            args.repeat, args.feed_entries, args.seed)
+    results = {
+        'revision': _get_git_revision(),
+        'python': platform.python_version(),
+        'shape': {
+            'platforms': args.platforms,
+            'depth': args.depth,
+            'branching': args.branching,
+            'versions': args.versions,
+            'files': args.files,
+            'seed': args.seed,
+            'ini_count': ini_count,
+        },
+        'feed_entries': args.feed_entries,
+        'jobs': args.jobs,
+        'backend': args.backend,
+        'repeat': args.repeat,
+        'seconds': timings,
+    }
+    if not args.skip_memory:
+        results['peak_memory_bytes'] = _get_peak_memory(args, feed_path)
+    return results
+
+
+def main(arg_list=None):
+    """CLI entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--platforms',
+        type=int,
+        default=7,
+        help='Number of top-level platforms (Default: %(default)s)')
+    parser.add_argument(
+        '--depth',
+        type=int,
+        default=1,
+        help='Directory levels below each platform (Default: %(default)s)')
+    parser.add_argument(
+        '--branching',
+        type=int,
+        default=2,
+        help='Subdirectories per directory level (Default: %(default)s)')
+    parser.add_argument(
+        '--versions',
+        type=int,
+        default=90,
+        help='Version INIs per leaf directory (Default: %(default)s)')
+    parser.add_argument(
+        '--files',
+        type=int,
+        default=4,
+        help='Files per version INI (Default: %(default)s)')
+    parser.add_argument(
+        '--feed-entries',
+        type=int,
+        default=10000,
+        help='Entries in the standalone feed whose serialization is timed. '
+        '0 skips it. (Default: %(default)s)')
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Seed for the generated tree (Default: %(default)s)')
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=1,
+        help='Worker processes for the generator (Default: %(default)s)')
+    parser.add_argument(
+        '--backend',
+        choices=site_generator._BACKENDS,  # pylint: disable=protected-access
+        default=site_generator._BACKENDS[0],  # pylint: disable=protected-access
+        help='Rendering backend (Default: %(default)s)')
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Runs per measurement; the fastest is reported. '
+        '(Default: %(default)s)')
+    parser.add_argument(
+        '--skip-memory',
+        action='store_true',
+        help='Skip the (slow) peak memory measurement')
+    parser.add_argument(
+        '--output', type=pathlib.Path, help='Also write the results as JSON')
+    parser.add_argument(
+        '--keep',
+        type=pathlib.Path,
+        help='Generate the tree in this new directory and keep it afterwards')
+    args = parser.parse_args(args=arg_list)
+    if args.jobs < 1 or args.repeat < 1:
+        parser.error('--jobs and --repeat must be at least 1')
+    if args.feed_entries < 0:
+        parser.error('--feed-entries must not be negative')
+
+    original_cwd = os.getcwd()
+    try:
+        if args.keep:
+            args.keep.mkdir(parents=True)
+            results = run_benchmark(args, args.keep.resolve())
+        else:
+            with tempfile.TemporaryDirectory() as work_dir:
+                results = run_benchmark(args, pathlib.Path(work_dir))
+                # The temporary directory cannot be removed while inside it
+                os.chdir(original_cwd)
+    finally:
+        os.chdir(original_cwd)
+
+    print('Synthetic tree: {ini_count} INIs ({platforms} platforms, '
+          'depth {depth}, branching {branching}, {versions} versions, '
+          '{files} files)'.format(**results['shape']))
+    for name, seconds in results['seconds'].items():
+        print('{:<28}{:9.3f}s'.format(name, seconds))
+    if 'peak_memory_bytes' in results:
+        print('{:<28}{:9.1f}MiB'.format('peak_memory',
+                                        results['peak_memory_bytes'] / 2**20))
+    if args.output:
+        with args.output.open('w') as output_file:
+            json.dump(results, output_file, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
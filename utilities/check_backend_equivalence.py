@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2026 The ungoogled-chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+'''
+Checks that the html and markdown backends of the site generator produce
+identical websites
+
+A small config/platforms tree is generated in a temporary directory and built
+once with each backend, and every output file is compared byte for byte. The
+display names, file names, URLs and notes of the tree contain characters that
+are special in Markdown or HTML, such as &, <, _ and *. Everything runs
+offline.
+
+Exits with 1 and shows the first difference if any output differs.
+'''
+
+import argparse
+import contextlib
+import difflib
+import io
+import os
+import os.path
+import pathlib
+import shutil
+import sys
+import tempfile
+
+if __name__ == "__main__" and (__package__ is None or __package__ == ""):
+
+    def _fix_relative_import():
+        """Allow relative imports to work from anywhere"""
+        parent_path = os.path.dirname(
+            os.path.realpath(os.path.abspath(__file__)))
+        sys.path.insert(0, os.path.dirname(parent_path))
+        global __package__  #pylint: disable=global-variable-undefined
+        __package__ = os.path.basename(parent_path)  #pylint: disable=redefined-builtin
+        __import__(__package__)
+        sys.path.pop(0)
+
+    _fix_relative_import()
+
+from . import site_generator  # pylint: disable=wrong-import-position
+
+_REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# Path relative to config/platforms -> display_name
+_DISPLAY_NAMES = {
+    '.': 'Releases & <downloads>',
+    'snake_case': 'Tom & Jerry <beta> *nightly* build_64',
+    'snake_case/x86_64': 'x86_64 & arm_64 **optimized**',
+    'snake_case/x86_64/under_score': '_underscored_ name_with_parts',
+    'stars': '*Star* & <Stripes>',
+    'plain': 'Portable & static x86_64',
+    'plain/arm_64': 'ARM64 & aarch64_be',
+}
+
+# Path relative to config/platforms -> install_info
+_INSTALL_INFOS = {
+    'snake_case': 'Run `install_me.sh` & see [the_docs](https://example.org/'
+    'a_b?c=1&d=2)',
+}
+
+# File names and URLs of versions; {version} is the version.
+# The listings of the first ones are emitted directly as HTML by the html
+# backend, and those of the others go through Markdown.
+_LITERAL_FILES = (
+    ('ungoogled-chromium_{version}_amd64.tar.xz',
+     'https://github.com/user/repo/releases/download/{version}/'
+     'ungoogled-chromium_{version}_amd64.tar.xz'),
+    ('chromium & friends_{version}.zip',
+     'https://example.org/get?name=chromium_{version}&arch=x86_64&*=1'),
+)
+_MARKDOWN_FILES = _LITERAL_FILES + (
+    ('chromium*{version}*&<x>_y.deb',
+     'https://example.org/download?name=chromium_{version}&arch=*&lt=<x>'),
+    ('__init__{version}.zip', 'https://example.org/__init__/{version}.zip'),
+)
+
+# (Directory relative to config/platforms, version, publication time, note,
+# files)
+_VERSIONS = (
+    ('snake_case/x86_64', '90.0.4430.85-1', '2021-04-21T10:00:00.000000',
+     'Fixes *this* & <that> in some_function_name', _MARKDOWN_FILES),
+    ('snake_case/x86_64', '91.0.4472.77-1.1', '2021-06-01T10:00:00.000000',
+     None, _LITERAL_FILES),
+    ('snake_case/x86_64/under_score', '92.0.4515.107-1',
+     '2021-07-20T10:00:00.000000', 'Only _one_ __file__', _MARKDOWN_FILES),
+    ('stars', '93.0.4577.63-1', '2021-09-01T10:00:00.000000',
+     'A **bold** note with a [link](https://example.org/?x=1&y=2)',
+     _MARKDOWN_FILES),
+    ('plain', '94.0.4606.61-1', '2021-09-22T10:00:00.000000', None,
+     _LITERAL_FILES),
+    ('plain/arm_64', '94.0.4606.61-1', '2021-09-23T10:00:00.000000',
+     'Same as x86_64 & arm_64', _LITERAL_FILES),
+)
+
+
+def write_fixture_tree(root):
+    """Writes config/ with the page templates and the fixture tree under root"""
+    shutil.copytree(
+        str(_REPO_ROOT / 'config' / 'page_templates'),
+        str(root / 'config' / 'page_templates'))
+    platforms_root = root / 'config' / 'platforms'
+    for dir_name, display_name in _DISPLAY_NAMES.items():
+        dir_path = platforms_root / dir_name
+        dir_path.mkdir(parents=True, exist_ok=True)
+        (dir_path / 'display_name').write_text(display_name + '\n')
+    for dir_name, install_info in _INSTALL_INFOS.items():
+        (platforms_root / dir_name / 'install_info').write_text(install_info +
+                                                                '\n')
+    for dir_name, version, publication_time, note, files in _VERSIONS:
+        sections = [
+            '[_metadata]\npublication_time = {}\ngithub_author = a_b*c'.format(
+                publication_time)
+        ]
+        if note is not None:
+            sections[0] += '\nnote = {}'.format(note)
+        for file_index, (filename, url) in enumerate(files):
+            sections.append('[{}]\nurl = {}\nsha256 = {:064x}'.format(
+                filename.format(version=version), url.format(version=version),
+                file_index))
+        (platforms_root / dir_name / (version + '.ini')).write_text(
+            '\n\n'.join(sections) + '\n')
+
+
+def build(work_dir, backend):
+    """Builds the website of the fixture tree in work_dir with backend"""
+    write_fixture_tree(work_dir)
+    original_cwd = os.getcwd()
+    # site_generator works relative to the repository root
+    os.chdir(str(work_dir))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            root_dir = site_generator.read_config()
+            site_generator.write_website(
+                root_dir, pathlib.Path('feed.xml'), backend=backend)
+    finally:
+        os.chdir(original_cwd)
+
+
+def get_output_files(work_dir):
+    """Returns a dict of the POSIX path of each output file to its contents"""
+    output_paths = [work_dir / 'index.html', work_dir / 'feed.xml']
+    output_paths.extend(
+        x for x in (work_dir / 'releases').rglob('*') if x.is_file())
+    return {
+        x.relative_to(work_dir).as_posix(): x.read_bytes()
+        for x in output_paths
+    }
+
+
+def compare_outputs(html_files, markdown_files):
+    """
+    Prints the differences between the outputs of both backends.
+    Returns the number of files that differ.
+    """
+    differing_paths = sorted(
+        x for x in set(html_files) | set(markdown_files)
+        if html_files.get(x) != markdown_files.get(x))
+    for path in differing_paths:
+        if path not in html_files or path not in markdown_files:
+            print('Only written by one backend: {}'.format(path))
+        else:
+            print('Differs: {}'.format(path))
+    if differing_paths:
+        path = differing_paths[0]
+        diff_lines = difflib.unified_diff(
+            html_files.get(path, b'').decode('UTF-8').splitlines(),
+            markdown_files.get(path, b'').decode('UTF-8').splitlines(),
+            'html/' + path,
+            'markdown/' + path,
+            lineterm='')
+        print('\n'.join(diff_lines))
+    return len(differing_paths)
+
+
+def main(arg_list=None):
+    """CLI entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--keep',
+        type=pathlib.Path,
+        help='Build in html/ and markdown/ of this new directory and keep '
+        'them afterwards')
+    args = parser.parse_args(args=arg_list)
+
+    with contextlib.ExitStack() as stack:
+        if args.keep:
+            args.keep.mkdir(parents=True)
+            work_dir = args.keep.resolve()
+        else:
+            work_dir = pathlib.Path(
+                stack.enter_context(tempfile.TemporaryDirectory()))
+        outputs = dict()
+        for backend in ('html', 'markdown'):
+            backend_dir = work_dir / backend
+            backend_dir.mkdir()
+            build(backend_dir, backend)
+            outputs[backend] = get_output_files(backend_dir)
+    difference_count = compare_outputs(outputs['html'], outputs['markdown'])
+    if difference_count:
+        print('ERROR: {} of {} files differ between the backends'.format(
+            difference_count, len(outputs['html'])))
+        return 1
+    print('All {} files are identical with both backends'.format(
+        len(outputs['html'])))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
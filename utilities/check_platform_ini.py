@@ -14,16 +14,19 @@ You will need to specify the INI files to check. There are certain methods to do
 
     In both cases, non-INI files will be ignored.
 * If no CLI argument is specified, then the tool will ask git via the CLI for a list of modified files in the working tree.
+* With --all, every INI in config/platforms is audited, and dead links are summarized by platform at the end, and in a JSON report. An interrupted audit is resumed by the next run with --all.
 '''
 
 import argparse
+import collections
+import datetime
+import json
 import os.path
 import subprocess
 import sys
+import time
 from pathlib import Path
 
-import requests
-
 if __name__ == "__main__" and (__package__ is None or __package__ == ""):
 
     def _fix_relative_import():
@@ -39,6 +42,18 @@ if __name__ == "__main__" and (__package__ is None or __package__ == ""):
     _fix_relative_import()
 
 from . import _config_parsing
+from . import _site_output
+from . import _url_checking
+
+_PLATFORMS = Path('config/platforms')
+# Kept out of the published tree, like the caches of site_generator.py
+_URL_CHECK_CACHE = Path('.cache/url_checks.json')
+_AUDIT_STATE = Path('.cache/audit_state.json')
+_AUDIT_SUMMARY = Path('.cache/audit_summary.json')
+_AUDIT_SUMMARY_FORMAT = 1
+
+# Minimum number of seconds between saves of the audit state
+_AUDIT_CHECKPOINT_INTERVAL = 10
 
 
 def get_ini_set(filelist_args):
@@ -68,23 +83,311 @@ def get_ini_set(filelist_args):
     return set(x for x in map(Path, file_set) if x.suffix.lower() == '.ini')
 
 
-def verify_ini_files(inipath_iter):
-    with requests.Session() as request_session:
-        for inipath in inipath_iter:
-            print('Checking', str(inipath))
-            platform_version_files, _, _, _, _ = _config_parsing.parse_version_ini(
-                inipath)
-            for filename, filemeta in platform_version_files.items():
-                fileurl, _ = filemeta
-                response = request_session.get(
-                    fileurl,
-                    allow_redirects=True,
-                    headers={'Range': 'bytes=0-1'})
-                if not response.ok:
-                    print(
-                        f'ERROR: Got {response.status_code} ({response.reason}) for file: {filename}',
-                        file=sys.stderr)
-                    return 1
+def _get_ini_files(inipath):
+    """Returns a list of (file name, URL) of the files in the INI at inipath"""
+    platform_version_files, _, _, _, _ = _config_parsing.parse_version_ini(
+        inipath)
+    return [(filename, fileurl)
+            for filename, (fileurl, _) in platform_version_files.items()]
+
+
+def _check_urls(urls, progress, jobs, per_host, timeout, retries, cache_path,
+                cache_ttl, refresh):
+    """
+    Checks urls with a UrlChecker and the URL check cache at cache_path, if
+    given. Returns a dict of URL to UrlCheckResult.
+    """
+    cache = None
+    if cache_path is not None:
+        cache = _url_checking.UrlCheckCache.load(cache_path, cache_ttl)
+    check_start = time.time()
+    try:
+        with _url_checking.UrlChecker(
+                max_workers=jobs,
+                max_per_host=per_host,
+                timeout=timeout,
+                retries=retries) as url_checker:
+            results = url_checker.check_all(urls,
+                                            progress=progress,
+                                            cache=cache,
+                                            refresh=refresh)
+    finally:
+        # Keep the results of an interrupted run
+        if cache is not None:
+            cache.save(cache_path)
+    if cache is not None:
+        cached_count = sum(1 for x in results.values()
+                           if x.checked_at < check_start)
+        print(f'Used cached results for {cached_count} of {len(results)} URLs')
+    retry_count = sum(x.retries for x in results.values())
+    if retry_count:
+        retried_count = sum(1 for x in results.values() if x.retries)
+        print(f'Retried {retry_count} requests for {retried_count} URLs')
+    return results
+
+
+def verify_ini_files(inipath_iter,
+                     jobs=16,
+                     per_host=4,
+                     timeout=30,
+                     retries=4,
+                     cache_path=None,
+                     cache_ttl=24 * 60 * 60,
+                     refresh=False):
+    """
+    Checks the URLs of the files in the INIs of inipath_iter concurrently,
+    with at most jobs requests at once and per_host requests per host.
+    Transient failures are retried up to retries times.
+
+    If cache_path is given, URLs that passed the check less than cache_ttl
+    seconds ago are not checked again, unless refresh is True.
+
+    Every failing file is reported. Returns 1 if any failed, 0 otherwise.
+    """
+    checked_files = list()  # (INI path, file name, URL)
+    for inipath in sorted(inipath_iter):
+        print('Checking', str(inipath))
+        for filename, fileurl in _get_ini_files(inipath):
+            checked_files.append((inipath, filename, fileurl))
+    results = _check_urls((x[2] for x in checked_files), None, jobs, per_host,
+                          timeout, retries, cache_path, cache_ttl, refresh)
+    failure_count = 0
+    for inipath, filename, fileurl in checked_files:
+        result = results[fileurl]
+        if not result.ok:
+            failure_count += 1
+            print(
+                f'ERROR: {result.describe()} for file: {filename} ({inipath})',
+                file=sys.stderr)
+    if failure_count:
+        print(
+            f'ERROR: {failure_count} of {len(checked_files)} files failed the check',
+            file=sys.stderr)
+        return 1
+    return 0
+
+
+class _AuditState:
+    """
+    Checkpoint of an audit of all platform INIs
+
+    Each audited INI is recorded with its size and modification time, and the
+    files in it that failed the check. INIs that did not change since are not
+    checked again.
+    """
+
+    _FORMAT = 1
+
+    def __init__(self):
+        # str path -> [size, mtime, [[file name, URL, failure description]]]
+        self._entries = dict()
+
+    @classmethod
+    def load(cls, state_path):
+        """Loads the state at state_path, or returns an empty state"""
+        state = cls()
+        try:
+            with state_path.open() as state_file:
+                raw_state = json.load(state_file)
+        except (OSError, ValueError):
+            return state
+        if not isinstance(raw_state, dict):
+            return state
+        if raw_state.get('format') != cls._FORMAT:
+            return state
+        state._entries = raw_state['entries']
+        return state
+
+    def save(self, state_path):
+        """Atomically writes the state to state_path"""
+        raw_state = {
+            'format': self._FORMAT,
+            'entries': self._entries,
+        }
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        _site_output.replace_file_if_changed(
+            state_path,
+            json.dumps(raw_state, sort_keys=True).encode())
+
+    def get_failures(self, inipath):
+        """
+        Returns the failures recorded for inipath, or None if it was not
+        audited since it last changed
+        """
+        entry = self._entries.get(str(inipath))
+        if entry is None:
+            return None
+        size, mtime, failures = entry
+        ini_stat = inipath.stat()
+        if ini_stat.st_size != size or ini_stat.st_mtime_ns != mtime:
+            return None
+        return failures
+
+    def record(self, inipath, failures):
+        """Records the failures found by the audit of inipath"""
+        ini_stat = inipath.stat()
+        self._entries[str(inipath)] = [
+            ini_stat.st_size, ini_stat.st_mtime_ns, failures
+        ]
+
+    def prune(self, inipaths):
+        """Forgets the INIs that are not in inipaths"""
+        kept = set(map(str, inipaths))
+        for key in list(self._entries):
+            if key not in kept:
+                del self._entries[key]
+
+
+def _group_audit_failures(audited):
+    """
+    Returns the failures of audited, a dict of INI path to failures, as a dict
+    of platform directory to [(INI name, file name, URL, description)]
+    """
+    platform_failures = collections.defaultdict(list)
+    for inipath, failures in sorted(audited.items()):
+        platform = inipath.parent.relative_to(_PLATFORMS).as_posix()
+        for filename, fileurl, description in failures:
+            platform_failures[platform].append(
+                (inipath.name, filename, fileurl, description))
+    return platform_failures
+
+
+def _print_audit_summary(platform_failures, ini_count):
+    """
+    Prints the failures grouped by _group_audit_failures().
+    Returns the number of failures.
+    """
+    failure_count = sum(map(len, platform_failures.values()))
+    if not failure_count:
+        print(f'No dead links found in {ini_count} INIs')
+        return 0
+    print(f'{failure_count} dead links in {len(platform_failures)} platforms:')
+    for platform, failures in sorted(platform_failures.items()):
+        print()
+        print(f'{platform} ({len(failures)})')
+        for ininame, filename, fileurl, description in failures:
+            print(f'  {ininame}: {filename}: {description} ({fileurl})')
+    return failure_count
+
+
+def _write_audit_summary(summary_path, platform_failures, ini_count):
+    """Atomically writes the failures grouped by platform to summary_path"""
+    raw_summary = {
+        'format': _AUDIT_SUMMARY_FORMAT,
+        'completed_at': datetime.datetime.now(
+            datetime.timezone.utc).isoformat(timespec='seconds'),
+        'ini_count': ini_count,
+        'failure_count': sum(map(len, platform_failures.values())),
+        'platforms': {
+            platform: [{
+                'ini': ininame,
+                'file': filename,
+                'url': fileurl,
+                'failure': description,
+            } for ininame, filename, fileurl, description in failures]
+            for platform, failures in platform_failures.items()
+        },
+    }
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    _site_output.replace_file_if_changed(
+        summary_path,
+        json.dumps(raw_summary, indent=2, sort_keys=True).encode() + b'\n')
+
+
+def audit_ini_files(state_path=_AUDIT_STATE,
+                    summary_path=_AUDIT_SUMMARY,
+                    jobs=16,
+                    per_host=4,
+                    timeout=30,
+                    retries=4,
+                    cache_path=None,
+                    cache_ttl=24 * 60 * 60,
+                    refresh=False,
+                    restart=False):
+    """
+    Checks the URLs of every INI in config/platforms, like verify_ini_files(),
+    and prints the dead links grouped by platform. Once the audit is complete,
+    they are also written as JSON to summary_path, unless it is None.
+
+    While the audit runs, audited INIs are checkpointed to state_path. If it
+    is interrupted, the next audit resumes it, and only checks the INIs that
+    were not audited yet or changed since. Once an audit is complete, its
+    state is removed, so the next audit checks every INI again. restart
+    discards the state of an interrupted audit instead of resuming it.
+
+    Returns 1 if any file failed the check, 0 otherwise.
+    """
+    inipaths = sorted(_PLATFORMS.rglob('*.ini'))
+    state = _AuditState() if restart else _AuditState.load(state_path)
+    state.prune(inipaths)
+    audited = dict()  # INI path -> failures
+    pending_counts = dict()  # INI path -> number of its files left to check
+    url_files = collections.defaultdict(list)  # URL -> [(INI path, file name)]
+    resumed_count = 0
+    for inipath in inipaths:
+        failures = state.get_failures(inipath)
+        if failures is not None:
+            audited[inipath] = failures
+            resumed_count += 1
+            continue
+        ini_files = _get_ini_files(inipath)
+        if not ini_files:
+            state.record(inipath, [])
+            audited[inipath] = []
+            continue
+        # Failures are collected here until all files of the INI are checked
+        audited[inipath] = list()
+        pending_counts[inipath] = len(ini_files)
+        for filename, fileurl in ini_files:
+            url_files[fileurl].append((inipath, filename))
+    if resumed_count:
+        print(f'Resuming audit: {resumed_count} of {len(inipaths)} INIs '
+              'were already checked')
+    completed_count = len(audited) - len(pending_counts)
+    last_checkpoint = time.monotonic()
+
+    def _record_result(result):
+        nonlocal completed_count, last_checkpoint
+        for inipath, filename in url_files[result.url]:
+            if not result.ok:
+                audited[inipath].append(
+                    [filename, result.url, result.describe()])
+            pending_counts[inipath] -= 1
+            if pending_counts[inipath]:
+                continue
+            del pending_counts[inipath]
+            state.record(inipath, audited[inipath])
+            completed_count += 1
+            print(f'[{completed_count}/{len(inipaths)}] {inipath}'
+                  f' ({len(audited[inipath])} dead links)')
+        if time.monotonic() - last_checkpoint >= _AUDIT_CHECKPOINT_INTERVAL:
+            state.save(state_path)
+            last_checkpoint = time.monotonic()
+
+    try:
+        _check_urls(url_files, _record_result, jobs, per_host, timeout,
+                    retries, cache_path, cache_ttl, refresh)
+    except KeyboardInterrupt:
+        print(f'Interrupted; run again to resume the audit from {state_path}',
+              file=sys.stderr)
+        return 130
+    finally:
+        if pending_counts:
+            state.save(state_path)
+    platform_failures = _group_audit_failures(audited)
+    if summary_path is not None:
+        _write_audit_summary(summary_path, platform_failures, len(audited))
+    # The audit is complete, so the next one starts over
+    if state_path.exists():
+        state_path.unlink()
+    print()
+    failure_count = _print_audit_summary(platform_failures, len(audited))
+    if summary_path is not None:
+        print(f'Wrote the dead links to {summary_path}')
+    if failure_count:
+        print(f'ERROR: {failure_count} files failed the check',
+              file=sys.stderr)
+        return 1
     return 0
 
 
@@ -98,9 +401,100 @@ def main(arg_list=None):
         ('Zero or more paths to platform INIs to check. '
          'If nothing is specified, then the git working tree will be checked. '
          'Specify "-" to read standard input.'))
+    parser.add_argument(
+        '--all',
+        action='store_true',
+        help='Audit every INI in config/platforms. If the audit is '
+        'interrupted, the next one resumes it without checking the INIs it '
+        'already audited again.')
+    parser.add_argument(
+        '--restart',
+        action='store_true',
+        help='Start a new --all audit instead of resuming an interrupted one')
+    parser.add_argument(
+        '--state',
+        type=Path,
+        default=_AUDIT_STATE,
+        help='Checkpoint file of the --all audit (Default: %(default)s)')
+    parser.add_argument(
+        '--summary',
+        type=Path,
+        default=_AUDIT_SUMMARY,
+        help='JSON report of the dead links found by the --all audit, '
+        'grouped by platform (Default: %(default)s)')
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=16,
+        help='Maximum number of URLs to check at once (Default: %(default)s)')
+    parser.add_argument(
+        '--per-host',
+        type=int,
+        default=4,
+        help='Maximum number of URLs to check at once on the same host '
+        '(Default: %(default)s)')
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=30,
+        help='Connect and read timeout of each request, in seconds '
+        '(Default: %(default)s)')
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=4,
+        help='Maximum number of retries of a throttled or failed request '
+        '(Default: %(default)s)')
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Neither read nor update the cache of URL check results')
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Check every URL again, and replace its cached result')
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=24,
+        help='Hours for which a successful URL check is reused '
+        '(Default: %(default)s)')
     args = parser.parse_args(args=arg_list)
+    if args.jobs < 1 or args.per_host < 1:
+        parser.error('--jobs and --per-host must be at least 1')
+    if args.timeout <= 0:
+        parser.error('--timeout must be positive')
+    if args.retries < 0:
+        parser.error('--retries must not be negative')
+    if args.cache_ttl < 0:
+        parser.error('--cache-ttl must not be negative')
+    if args.restart and not args.all:
+        parser.error('--restart requires --all')
+    if args.all:
+        if args.ini_path:
+            parser.error('--all does not take INI paths')
+        return audit_ini_files(
+            state_path=args.state,
+            summary_path=args.summary,
+            jobs=args.jobs,
+            per_host=args.per_host,
+            timeout=args.timeout,
+            retries=args.retries,
+            cache_path=None if args.no_cache else _URL_CHECK_CACHE,
+            cache_ttl=args.cache_ttl * 60 * 60,
+            refresh=args.refresh,
+            restart=args.restart)
     inipath_set = get_ini_set(args.ini_path)
-    if verify_ini_files(inipath_set):
+    if verify_ini_files(
+            inipath_set,
+            jobs=args.jobs,
+            per_host=args.per_host,
+            timeout=args.timeout,
+            retries=args.retries,
+            cache_path=None if args.no_cache else _URL_CHECK_CACHE,
+            cache_ttl=args.cache_ttl * 60 * 60,
+            refresh=args.refresh):
         return 1
     if not inipath_set:
         print('Did not find any .ini files to check')
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2026 The ungoogled-chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+'''
+Checks the retry and throttling behaviour of the URL checker of
+check_platform_ini.py against a local stand-in release host
+
+The stand-in is a threaded HTTP server on localhost. It answers:
+
+* /files/NAME with 206 and a Content-Range, like a release download
+* /missing/NAME with 404
+* /flaky/NAME with 503 to its first two requests
+* /dated/NAME with 503 and an HTTP-date Retry-After to its first request
+* /down/NAME with 502 to every request
+* /throttled/NAME with 429 and Retry-After when more than a few requests to
+  /throttled/ are in progress
+
+The throttled URLs are requested through another host name than the others,
+since the checker adapts to each host separately. The pauses of that host are
+checked from the order in which the checker takes and gives back its request
+slots, so they do not depend on timing.
+
+Everything runs offline, in a few seconds. Exits with 1 if any check fails.
+'''
+
+import argparse
+import collections
+import email.utils
+import http.server
+import os
+import os.path
+import sys
+import threading
+import time
+import urllib.parse
+
+if __name__ == "__main__" and (__package__ is None or __package__ == ""):
+
+    def _fix_relative_import():
+        """Allow relative imports to work from anywhere"""
+        parent_path = os.path.dirname(
+            os.path.realpath(os.path.abspath(__file__)))
+        sys.path.insert(0, os.path.dirname(parent_path))
+        global __package__  #pylint: disable=global-variable-undefined
+        __package__ = os.path.basename(parent_path)  #pylint: disable=redefined-builtin
+        __import__(__package__)
+        sys.path.pop(0)
+
+    _fix_relative_import()
+
+from . import _url_checking  # pylint: disable=wrong-import-position
+
+# Seconds each response of the stand-in takes
+_LATENCY = 0.1
+# Concurrent requests to /throttled/ above which the stand-in answers 429
+_THROTTLE_LIMIT = 2
+# Retry-After of the 429 responses, in seconds
+_THROTTLE_DELAY = 1
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    '''
+    Stand-in release host that records the requests it receives
+
+    requests is a list of (path, start time, end time, status) of the
+    requests answered so far, with times from time.monotonic().
+    '''
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInRequestHandler)
+        self.lock = threading.Lock()
+        self.requests = list()
+        self.request_counts = collections.Counter()  # path -> requests
+        self.throttled_active = 0
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    @property
+    def throttled_url(self):
+        """Base URL of the same server under another host name"""
+        return 'http://localhost:{}/throttled/'.format(self.server_address[1])
+
+
+class StandInRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _get_status(self, request_count, over_limit):
+        """Returns the status and headers of the response to this request"""
+        prefix = self.path.split('/')[1]
+        if prefix == 'files':
+            return 206, {'Content-Range': 'bytes 0-1/123456'}
+        if prefix == 'flaky' and request_count <= 2:
+            return 503, {}
+        if prefix == 'dated' and request_count == 1:
+            retry_time = email.utils.formatdate(time.time() + 2, usegmt=True)
+            return 503, {'Retry-After': retry_time}
+        if prefix == 'down':
+            return 502, {}
+        if prefix == 'throttled':
+            if over_limit:
+                return 429, {'Retry-After': str(_THROTTLE_DELAY)}
+            return 206, {'Content-Range': 'bytes 0-1/123456'}
+        if prefix in ('flaky', 'dated'):
+            return 206, {'Content-Range': 'bytes 0-1/123456'}
+        return 404, {}
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        server = self.server
+        start_time = time.monotonic()
+        throttled = self.path.startswith('/throttled/')
+        with server.lock:
+            server.request_counts[self.path] += 1
+            request_count = server.request_counts[self.path]
+            if throttled:
+                server.throttled_active += 1
+                over_limit = server.throttled_active > _THROTTLE_LIMIT
+            else:
+                over_limit = False
+        try:
+            time.sleep(_LATENCY)
+            status, headers = self._get_status(request_count, over_limit)
+            body = b'ab' if status == 206 else b''
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                if throttled:
+                    server.throttled_active -= 1
+                server.requests.append(
+                    (self.path, start_time, time.monotonic(), status))
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class _RecordingHostLimit(_url_checking._HostLimit):  # pylint: disable=protected-access
+    """
+    Host limit that records the violations of its pauses
+
+    Each event is recorded while holding the lock of the limit, so the
+    recorded order is the order in which the checker acted.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.throttle_count = 0
+        # Requests started while the host was paused
+        self.paused_starts = 0
+        # Throttled requests that gave back their slot before pausing the host
+        self.early_releases = 0
+        self._holders = collections.Counter()  # thread ID -> slots held
+        self._throttled = set()  # IDs of threads that got a 429
+
+    def __enter__(self):
+        with self._condition:
+            super().__enter__()
+            if time.monotonic() < self._paused_until:
+                self.paused_starts += 1
+            self._holders[threading.get_ident()] += 1
+
+    def __exit__(self, *exc_info):
+        with self._condition:
+            thread_id = threading.get_ident()
+            self._holders[thread_id] -= 1
+            if thread_id in self._throttled:
+                self._throttled.discard(thread_id)
+                self.early_releases += 1
+            super().__exit__(*exc_info)
+
+    def throttle(self, delay):
+        with self._condition:
+            super().throttle(delay)
+            self.throttle_count += 1
+            self._throttled.discard(threading.get_ident())
+
+    def note_throttled(self):
+        """Records that the current thread received a 429 response"""
+        with self._condition:
+            self._throttled.add(threading.get_ident())
+
+
+class _RecordingUrlChecker(_url_checking.UrlChecker):
+    """UrlChecker that records how it pauses the hosts it checks"""
+
+    def _get_host_limit(self, url):
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._lock:
+            host_limit = self._host_limits.get(host)
+            if host_limit is None:
+                host_limit = _RecordingHostLimit(self.max_per_host,
+                                                 self._stopping)
+                self._host_limits[host] = host_limit
+        return host_limit
+
+    def _request(self, url, retries):
+        result, retryable, retry_after = super()._request(url, retries)
+        if result.status == 429:
+            self._get_host_limit(url).note_throttled()
+        return result, retryable, retry_after
+
+
+def _get_peak_concurrency(requests):
+    """Returns the most requests of (path, start, end, status) at once"""
+    events = sorted([(x[1], 1) for x in requests] + [(x[2], -1)
+                                                    for x in requests])
+    peak = active = 0
+    for _, change in events:
+        active += change
+        peak = max(peak, active)
+    return peak
+
+
+def run_checks(server):
+    """Runs the checks against server. Returns a list of failure messages."""
+    failures = list()
+
+    def _expect(condition, message):
+        print('{}: {}'.format('PASS' if condition else 'FAIL', message))
+        if not condition:
+            failures.append(message)
+
+    with _RecordingUrlChecker(
+            max_workers=16, max_per_host=6, retries=3, backoff=0.05,
+            max_delay=5) as url_checker:
+        urls = [
+            server.base_url + x for x in ('/files/a', '/missing/a',
+                                          '/flaky/a', '/dated/a', '/down/a')
+        ]
+        urls.extend(server.throttled_url + str(x) for x in range(12))
+        start_time = time.monotonic()
+        results = url_checker.check_all(urls)
+        elapsed = time.monotonic() - start_time
+        throttled_limit = url_checker._get_host_limit(  # pylint: disable=protected-access
+            server.throttled_url)
+
+    def _result(path):
+        return results[server.base_url + path]
+
+    _expect(_result('/files/a').ok and _result('/files/a').retries == 0,
+            'A working URL passes without retries')
+    _expect(
+        _result('/missing/a').status == 404
+        and server.request_counts['/missing/a'] == 1,
+        'A 404 fails without being retried')
+    _expect(
+        _result('/flaky/a').ok and _result('/flaky/a').retries == 2,
+        'Two 503 responses are retried, and the check passes')
+    dated_requests = sorted(x[1] for x in server.requests
+                            if x[0] == '/dated/a')
+    _expect(
+        _result('/dated/a').ok and len(dated_requests) == 2
+        and dated_requests[1] - dated_requests[0] >= 1,
+        'An HTTP-date Retry-After is waited for before retrying')
+    _expect(
+        _result('/down/a').status == 502 and _result('/down/a').retries == 3
+        and server.request_counts['/down/a'] == 4,
+        'A permanent 502 fails after all retries')
+    throttled_results = [
+        results[server.throttled_url + str(x)] for x in range(12)
+    ]
+    throttled_requests = [
+        x for x in server.requests if x[0].startswith('/throttled/')
+    ]
+    throttle_times = [x[2] for x in throttled_requests if x[3] == 429]
+    _expect(
+        all(x.ok for x in throttled_results) and throttle_times,
+        'Throttled URLs are retried until they pass')
+    _expect(
+        throttled_limit.throttle_count == len(throttle_times)
+        and not throttled_limit.early_releases,
+        'A throttled request pauses its host before the next request starts')
+    _expect(not throttled_limit.paused_starts,
+            'No request is made to a host while it asked to wait')
+    if throttle_times:
+        pause_start = min(throttle_times)
+        pause_end = pause_start + _THROTTLE_DELAY
+        _expect(
+            _get_peak_concurrency(
+                [x for x in throttled_requests if x[1] >= pause_end]) <
+            _get_peak_concurrency(
+                [x for x in throttled_requests if x[1] < pause_start]),
+            'Fewer requests are made to a host at once once it throttles')
+    _expect(
+        sum(x.retries for x in throttled_results) ==
+        len(throttle_times), 'Each throttled request is counted as a retry')
+    print('Checked {} URLs with {} requests in {:.1f}s'.format(
+        len(results), len(server.requests), elapsed))
+    return failures
+
+
+def _check_interruption(server):
+    """
+    Returns True if interrupting check_all() does not wait for the retry
+    delays of the checks in progress
+    """
+    url_checker = _url_checking.UrlChecker(
+        retries=3, backoff=60, max_delay=60)
+    interrupted_at = list()
+
+    def _interrupt(_):
+        interrupted_at.append(time.monotonic())
+        raise KeyboardInterrupt()
+
+    urls = [server.base_url + '/files/b']
+    urls.extend(server.base_url + '/down/b{}'.format(x) for x in range(4))
+    try:
+        url_checker.check_all(urls, progress=_interrupt)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        url_checker.close()
+    return bool(interrupted_at) and time.monotonic() - interrupted_at[0] < 5
+
+
+def main(arg_list=None):
+    """CLI entrypoint"""
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args(args=arg_list)
+
+    server = StandInServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        failures = run_checks(server)
+        interruptible = _check_interruption(server)
+        print('{}: An interrupted check does not wait for retry delays'.format(
+            'PASS' if interruptible else 'FAIL'))
+        if not interruptible:
+            failures.append('interruption')
+    finally:
+        server.shutdown()
+        server.server_close()
+    if failures:
+        print('ERROR: {} checks failed'.format(len(failures)))
+        return 1
+    print('All checks passed')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,15 +9,241 @@ Local webserver to view generated site
 '''
 
 import argparse
+import collections
+import datetime
+import email.utils
+import functools
+import http
 import http.server
+import io
+import os
+import posixpath
 import socketserver
+import stat
+import sys
+import threading
+import time
+import traceback
 import urllib.parse
+import zlib
 from pathlib import Path
 
+if __name__ == "__main__" and (__package__ is None or __package__ == ""):
+
+    def _fix_relative_import():
+        """Allow relative imports to work from anywhere"""
+        parent_path = os.path.dirname(
+            os.path.realpath(os.path.abspath(__file__)))
+        sys.path.insert(0, os.path.dirname(parent_path))
+        global __package__  #pylint: disable=global-variable-undefined
+        __package__ = os.path.basename(parent_path)  #pylint: disable=redefined-builtin
+        __import__(__package__)
+        sys.path.pop(0)
+
+    _fix_relative_import()
+
+from . import site_generator  # pylint: disable=wrong-import-position
+from . import _site_output  # pylint: disable=wrong-import-position
+
 _PREFIX = 'ungoogled-chromium-binaries'
+# Precompressed variants written by site_generator.py --precompress,
+# in order of preference
+_COMPRESSED_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+# Larger files are always read from disk
+_MAX_CACHED_FILE_SIZE = 256 * 1024
+# Files and directory written by site_generator.py. When the site is built
+# into memory, stale copies of them on disk are never served.
+_GENERATED_FILES = (
+    site_generator._OUTPUT_INDEX.as_posix(),  # pylint: disable=protected-access
+    site_generator._FEED_FILE,  # pylint: disable=protected-access
+)
+_GENERATED_DIR = site_generator._RELEASES.as_posix()  # pylint: disable=protected-access
+
+
+def _get_accepted_encodings(accept_encoding):
+    """Returns the set of encodings allowed by an Accept-Encoding header"""
+    accepted_encodings = set()
+    for item in accept_encoding.split(','):
+        encoding, _, parameters = item.partition(';')
+        encoding = encoding.strip().lower()
+        quality = parameters.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if encoding:
+            accepted_encodings.add(encoding)
+    return accepted_encodings
+
+
+def _is_generated_path(key):
+    """
+    Returns True if key, a path relative to the repository root, is one
+    written by site_generator.py (with or without its .html suffix)
+    """
+    for _, suffix in _COMPRESSED_SUFFIXES:
+        if key.endswith(suffix):
+            key = key[:-len(suffix)]
+    if not key or key == _GENERATED_DIR or key.startswith(_GENERATED_DIR +
+                                                           '/'):
+        return True
+    return key in _GENERATED_FILES or key + '.html' in _GENERATED_FILES
+
+
+def _stat_file(path):
+    """Returns the os.stat_result of path, or None if it does not exist"""
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+class FileCache:
+    '''
+    Bounded, thread-safe LRU cache of the contents of small files
+
+    Entries are keyed by path, and are only used while the size and
+    modification time of the file match the ones they were read with.
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()  # path -> (mtime, size, data)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, file_stat):
+        """Returns the cached contents of path, or None if missing or stale"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return None
+            if entry[:2] != (file_stat.st_mtime_ns, file_stat.st_size):
+                del self._entries[path]
+                self._size -= len(entry[2])
+                return None
+            self._entries.move_to_end(path)
+            return entry[2]
+
+    def put(self, path, file_stat, data):
+        """Caches data as the contents of path with the given stat"""
+        if len(data) > min(self.max_bytes, _MAX_CACHED_FILE_SIZE):
+            return
+        with self._lock:
+            previous_entry = self._entries.pop(path, None)
+            if previous_entry is not None:
+                self._size -= len(previous_entry[2])
+            self._entries[path] = (file_stat.st_mtime_ns, file_stat.st_size,
+                                   data)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, (_, _, evicted_data) = self._entries.popitem(last=False)
+                self._size -= len(evicted_data)
+
+
+def _get_tree_snapshot(root):
+    """Returns a dict of the path of each file under root to its mtime and size"""
+    snapshot = dict()
+    for dir_path, _, file_names in os.walk(str(root)):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            file_stat = _stat_file(file_path)
+            if file_stat is not None:
+                snapshot[file_path] = (file_stat.st_mtime_ns, file_stat.st_size)
+    return snapshot
+
+
+def _build_on_disk():
+    """Builds the site incrementally into the repository"""
+    site_generator.main(['--incremental', '--lazy'])
+
+
+def _build_into_memory(memory_output):
+    """Builds the site incrementally into memory_output"""
+    root_dir = site_generator.read_config(
+        cache_path=site_generator._CONFIG_CACHE, lazy=True)  # pylint: disable=protected-access
+    site_generator.write_website(
+        root_dir,
+        Path(site_generator._FEED_FILE),  # pylint: disable=protected-access
+        incremental=True,
+        memory_output=memory_output)
+
+
+class SiteWatcher(threading.Thread):
+    '''
+    Polls the config directory, and rebuilds the site incrementally in this
+    process with build_function whenever a file in it changes
+
+    The build manifest of site_generator maps the changed INI, display_name,
+    install_info and template files to the pages that depend on them, so only
+    those pages are rendered again.
+    '''
+
+    def __init__(self, interval, build_function):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.build_function = build_function
+        # Templates change while the server runs
+        site_generator._TEMPLATES.check_mtime = True  # pylint: disable=protected-access
+
+    def rebuild(self):
+        """Rebuilds the site, printing any error instead of raising it"""
+        start_time = time.perf_counter()
+        try:
+            self.build_function()
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+            print('Rebuild failed; still serving the previous build')
+            return
+        print('Rebuilt in {:.3f}s'.format(time.perf_counter() - start_time))
+
+    def run(self):
+        snapshot = _get_tree_snapshot(site_generator._CONFIG)  # pylint: disable=protected-access
+        while True:
+            time.sleep(self.interval)
+            new_snapshot = _get_tree_snapshot(site_generator._CONFIG)  # pylint: disable=protected-access
+            if new_snapshot == snapshot:
+                continue
+            changed_paths = sorted(
+                x for x in set(snapshot) | set(new_snapshot)
+                if snapshot.get(x) != new_snapshot.get(x))
+            snapshot = new_snapshot
+            print('Changed:', ', '.join(changed_paths[:5]),
+                  '(and {} more)'.format(len(changed_paths) - 5)
+                  if len(changed_paths) > 5 else '')
+            self.rebuild()
+
+
+class BinariesHTTPServer(http.server.ThreadingHTTPServer):
+    '''
+    Serves each request in its own thread, with a shared FileCache
+
+    If memory_output is a MemoryOutput, the files generated into it are
+    served instead of the ones on disk.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self,
+                 server_address,
+                 handler_class,
+                 file_cache=None,
+                 verbose=False,
+                 memory_output=None):
+        super().__init__(server_address, handler_class)
+        self.file_cache = file_cache
+        self.verbose = verbose
+        self.memory_output = memory_output
 
 
 class BinariesHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # Keep connections open between requests; all responses have a length
+    protocol_version = 'HTTP/1.1'
+    # Seconds before an idle connection is closed, freeing its thread
+    timeout = 30
+
     def translate_path(self, path):
         translated_path = Path(super().translate_path(path))
         translated_path = translated_path.relative_to(Path.cwd())
@@ -25,12 +251,202 @@ class BinariesHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             translated_path = translated_path.relative_to(_PREFIX)
         except ValueError:
             pass
-        if not translated_path.exists():
-            translated_path = translated_path.with_name(translated_path.name +
-                                                        '.html')
-        print('Attempting to read path:', translated_path)
         return str(translated_path.absolute())
 
+    def _find_file(self):
+        """
+        Returns the path and os.stat_result of the file or directory for the
+        request, trying an .html suffix if it does not exist as is.
+        The stat result is None if neither exists.
+        """
+        path = self.translate_path(self.path)
+        file_stat = _stat_file(path)
+        if file_stat is None and not path.endswith('/'):
+            html_stat = _stat_file(path + '.html')
+            if html_stat is not None:
+                path, file_stat = path + '.html', html_stat
+        if getattr(self.server, 'verbose', False):
+            print('Attempting to read path:', path)
+        return path, file_stat
+
+    def _find_compressed_variant(self, path):
+        """
+        Returns the (encoding, path, os.stat_result) of the preferred
+        precompressed variant of path the client accepts, or None
+        """
+        accepted_encodings = _get_accepted_encodings(
+            self.headers.get('Accept-Encoding', ''))
+        for encoding, suffix in _COMPRESSED_SUFFIXES:
+            if encoding not in accepted_encodings:
+                continue
+            variant_stat = _stat_file(path + suffix)
+            if variant_stat is not None and stat.S_ISREG(variant_stat.st_mode):
+                return encoding, path + suffix, variant_stat
+        return None
+
+    def _is_not_modified(self, etag, file_stat):
+        """Evaluates If-None-Match, or otherwise If-Modified-Since"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            client_etags = [x.strip() for x in if_none_match.split(',')]
+            return '*' in client_etags or etag in client_etags or (
+                'W/' + etag) in client_etags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is None or file_stat is None:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        modified = datetime.datetime.fromtimestamp(
+            int(file_stat.st_mtime), datetime.timezone.utc)
+        return modified <= since
+
+    def _redirect_to_directory(self):
+        parts = urllib.parse.urlsplit(self.path)
+        self.send_response(http.HTTPStatus.MOVED_PERMANENTLY)
+        self.send_header(
+            'Location',
+            urllib.parse.urlunsplit((parts[0], parts[1], parts[2] + '/',
+                                     parts[3], parts[4])))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _send_head_from_memory(self, files):
+        """
+        Sends the headers for the request from the generated files in memory,
+        with the same prefix stripping and .html fallback as for the disk.
+        Paths that site_generator.py generates but the build in memory lacks
+        get a 404, instead of a stale copy from the disk.
+        Returns (False, None) if the request is for a file that is not
+        generated, or otherwise (True, file object of the body or None).
+        """
+        url_path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        key = posixpath.normpath(url_path).strip('/')
+        if key == _PREFIX or key.startswith(_PREFIX + '/'):
+            key = key[len(_PREFIX) + 1:]
+        directory_index = posixpath.join(key, 'index.html')
+        if url_path.endswith('/') or not key:
+            candidates = (directory_index, )
+        elif key not in files and directory_index in files:
+            self._redirect_to_directory()
+            return True, None
+        else:
+            candidates = (key, key + '.html')
+        for candidate in candidates:
+            data = files.get(candidate)
+            if data is not None:
+                break
+        else:
+            if not _is_generated_path(key):
+                return False, None
+            self.send_error(http.HTTPStatus.NOT_FOUND, 'File not found')
+            return True, None
+        if getattr(self.server, 'verbose', False):
+            print('Attempting to read generated file:', candidate)
+
+        etag = '"{:x}-{:x}"'.format(zlib.crc32(data), len(data))
+        if self._is_not_modified(etag, None):
+            self.send_response(http.HTTPStatus.NOT_MODIFIED)
+            self._send_validators(etag, None)
+            self.end_headers()
+            return True, None
+        self.send_response(http.HTTPStatus.OK)
+        self.send_header('Content-type', self.guess_type(candidate))
+        self.send_header('Content-Length', str(len(data)))
+        self._send_validators(etag, None)
+        self.end_headers()
+        return True, io.BytesIO(data)
+
+    def send_head(self):
+        """
+        Sends the headers for the requested file, or a 304 response if the
+        client's copy is current. Returns a file object of the body, or None.
+
+        If the server has a MemoryOutput, generated files are only served from
+        it, and only other files such as stylesheets from the disk. A precompressed variant of a file on disk
+        is sent if the client accepts it. Small files are served from the
+        FileCache of the server.
+        """
+        memory_output = getattr(self.server, 'memory_output', None)
+        if memory_output is not None:
+            handled, body_file = self._send_head_from_memory(
+                memory_output.files)
+            if handled:
+                return body_file
+
+        path, file_stat = self._find_file()
+        if file_stat is None:
+            self.send_error(http.HTTPStatus.NOT_FOUND, 'File not found')
+            return None
+        if stat.S_ISDIR(file_stat.st_mode):
+            if not urllib.parse.urlsplit(self.path).path.endswith('/'):
+                self._redirect_to_directory()
+                return None
+            index_path = os.path.join(path, 'index.html')
+            index_stat = _stat_file(index_path)
+            if index_stat is None:
+                return self.list_directory(path)
+            path, file_stat = index_path, index_stat
+        content_type = self.guess_type(path)
+
+        content_encoding = None
+        variant = self._find_compressed_variant(path)
+        if variant is not None:
+            content_encoding, path, file_stat = variant
+        etag = '"{:x}-{:x}{}"'.format(file_stat.st_mtime_ns, file_stat.st_size,
+                                      '-' + content_encoding
+                                      if content_encoding else '')
+
+        if self._is_not_modified(etag, file_stat):
+            self.send_response(http.HTTPStatus.NOT_MODIFIED)
+            self._send_validators(etag, file_stat)
+            self.end_headers()
+            return None
+
+        file_cache = getattr(self.server, 'file_cache', None)
+        data = None
+        if file_cache is not None:
+            data = file_cache.get(path, file_stat)
+        if data is None:
+            try:
+                with open(path, 'rb') as body_file:
+                    data = body_file.read()
+            except OSError:
+                self.send_error(http.HTTPStatus.NOT_FOUND, 'File not found')
+                return None
+            if file_cache is not None:
+                file_cache.put(path, file_stat, data)
+
+        self.send_response(http.HTTPStatus.OK)
+        self.send_header('Content-type', content_type)
+        if content_encoding:
+            self.send_header('Content-Encoding', content_encoding)
+        self.send_header('Content-Length', str(len(data)))
+        self._send_validators(etag, file_stat)
+        self.end_headers()
+        return io.BytesIO(data)
+
+    def _send_validators(self, etag, file_stat):
+        self.send_header('ETag', etag)
+        if file_stat is not None:
+            self.send_header('Last-Modified',
+                             self.date_time_string(file_stat.st_mtime))
+        # Clients may reuse their copy, but must revalidate it first
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+
+
+class SingleThreadedRequestHandler(BinariesHTTPRequestHandler):
+    '''
+    Closes the connection after each response, so that a client keeping its
+    connection open cannot block a server that handles one connection at a time
+    '''
+
+    protocol_version = 'HTTP/1.0'
+
 
 def main():
     '''CLI Entrypoint'''
@@ -41,9 +457,73 @@ def main():
         type=int,
         default='8086',
         help='Port to listen on on localhost')
+    parser.add_argument(
+        '--single-threaded',
+        action='store_true',
+        help='Serve one request at a time instead of one thread per request')
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=64,
+        metavar='MIB',
+        help=('Memory for caching the contents of small files, in MiB. '
+              '0 disables the cache. (Default: %(default)s)'))
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help=('Rebuild the site incrementally whenever a file in config/ '
+              'changes, while serving it'))
+    parser.add_argument(
+        '--memory',
+        action='store_true',
+        help=('Build the site into memory and serve it from there, without '
+              'writing it to disk. Other files are still served from disk.'))
+    parser.add_argument(
+        '--watch-interval',
+        type=float,
+        default=0.25,
+        metavar='SECONDS',
+        help='How often to check config/ for changes with --watch. '
+        '(Default: %(default)s)')
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        action='store_true',
+        help='Print the path of the file read for each request')
     args = parser.parse_args()
-    httpd = socketserver.TCPServer(('localhost', args.port),
-                                   BinariesHTTPRequestHandler)
+    if args.cache_size < 0:
+        parser.error('--cache-size must not be negative')
+    if args.watch_interval <= 0:
+        parser.error('--watch-interval must be positive')
+
+    file_cache = None
+    if args.cache_size:
+        file_cache = FileCache(args.cache_size * 1024 * 1024)
+    memory_output = None
+    if args.memory:
+        memory_output = _site_output.MemoryOutput()
+    if args.single_threaded:
+        httpd = socketserver.TCPServer(('localhost', args.port),
+                                       SingleThreadedRequestHandler)
+        httpd.file_cache = file_cache
+        httpd.verbose = args.verbose
+        httpd.memory_output = memory_output
+    else:
+        httpd = BinariesHTTPServer(('localhost', args.port),
+                                   BinariesHTTPRequestHandler, file_cache,
+                                   args.verbose, memory_output)
+
+    if args.watch or args.memory:
+        if args.memory:
+            build_function = functools.partial(_build_into_memory,
+                                               memory_output)
+        else:
+            build_function = _build_on_disk
+        watcher = SiteWatcher(args.watch_interval, build_function)
+        # Bring the site up to date before serving it
+        watcher.rebuild()
+        if args.watch:
+            watcher.start()
 
     print('Serving on localhost at port', args.port)
     httpd.serve_forever()
@@ -24,6 +24,10 @@
 
         print feed.to_string()
 
+        # Or write it to a file without building the whole string
+        with open("feed.xml", "w", encoding="utf-8") as feed_file:
+            feed.write_to(feed_file)
+
     :copyright: (c) 2010 by the Werkzeug Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
@@ -39,6 +43,7 @@ if sys.version_info.major >= 3:
 _unicode = str if sys.version_info.major >= 3 else unicode
 
 XHTML_NAMESPACE = 'http://www.w3.org/1999/xhtml'
+FEED_HISTORY_NAMESPACE = 'http://purl.org/syndication/history/1.0'
 
 
 def escape(s, quote=False):
@@ -51,6 +56,13 @@ def escape(s, quote=False):
     :param s: the string to escape.
     :param quote: set to true to also escape double quotes.
     """
+    if s.__class__ is _unicode:
+        # Fast path for plain strings, which rarely need escaping
+        if '&' in s or '<' in s or '>' in s:
+            s = s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        if quote and '"' in s:
+            s = s.replace('"', "&quot;")
+        return s
     if s is None:
         return ''
     elif hasattr(s, '__html__'):
@@ -75,6 +87,11 @@ def _make_text_block(name, content, content_type=None):
 
 def format_iso8601(obj, timezone):
     """Format a datetime object for iso8601"""
+    if isinstance(obj, datetime) and obj.year >= 1000 and '%' not in timezone:
+        # Same result as strftime below, which is several times slower
+        return '%d-%02d-%02dT%02d:%02d:%02d%s' % (
+            obj.year, obj.month, obj.day, obj.hour, obj.minute, obj.second,
+            timezone)
     updated = '%Y-%m-%dT%H:%M:%S' + timezone
     return obj.strftime(updated)
 
@@ -120,6 +137,11 @@ class AtomFeed(object):
                       to `None`.
     :param entries: a list with the entries for the feed. Entries can also
                     be added later with :meth:`add`.
+    :param archive: marks the feed as an archive document with the
+                    ``fh:archive`` element (see :rfc:`5005`).  Archive
+                    documents link to each other and to the current feed
+                    with ``prev-archive``, ``next-archive`` and ``current``
+                    links in `links`.
 
     For more information on the elements see
     http://www.atomenabled.org/developers/syndication/
@@ -127,6 +149,11 @@ class AtomFeed(object):
     Everywhere where a list is demanded, any iterable can be used.
     """
 
+    __slots__ = ('title', 'title_type', 'url', 'feed_url', 'id', 'updated',
+                 'timezone', 'author', 'icon', 'logo', 'rights', 'rights_type',
+                 'subtitle', 'subtitle_type', 'generator', 'links', 'archive',
+                 'entries', '_last_feed_string')
+
     default_generator = ('PyAtom', None, None)
 
     def __init__(self, title=None, entries=None, **kwargs):
@@ -148,6 +175,7 @@ class AtomFeed(object):
         if self.generator is None:
             self.generator = self.default_generator
         self.links = kwargs.get('links', [])
+        self.archive = kwargs.get('archive', False)
         self.entries = entries and list(entries) or []
         #No need to fill in feed string again if nothing changed.
         self._last_feed_string = None
@@ -190,11 +218,16 @@ class AtomFeed(object):
                 self.author = ({'name': u'unbekannter Autor'}, )
 
         if not self.updated:
-            dates = sorted([entry.updated for entry in self.entries])
-            self.updated = dates and dates[-1] or datetime.utcnow()
+            self.updated = max((entry.updated for entry in self.entries),
+                               default=None) or datetime.utcnow()
 
         yield u'<?xml version="1.0" encoding="utf-8"?>\n'
-        yield u'<feed xmlns="http://www.w3.org/2005/Atom">\n'
+        if self.archive:
+            yield u'<feed xmlns="http://www.w3.org/2005/Atom" xmlns:fh="%s">\n' % \
+                FEED_HISTORY_NAMESPACE
+            yield u'  <fh:archive />\n'
+        else:
+            yield u'<feed xmlns="http://www.w3.org/2005/Atom">\n'
         yield '  ' + _make_text_block('title', self.title, self.title_type)
         yield u'  <id>%s</id>\n' % escape(self.id)
         yield u'  <updated>%s</updated>\n' % format_iso8601(self.updated, self.timezone)
@@ -246,6 +279,17 @@ class AtomFeed(object):
         self._last_feed_string = feed_string if not encoding else feed_string.encode(encoding)
         return self._last_feed_string
 
+    def write_to(self, fileobj):
+        """
+            Write the feed to a text file object piece by piece, without
+            building the whole feed string in memory.
+            :param fileobj: The file object to write to. Its encoding must
+                            match the utf-8 declared by the feed.
+        """
+        write = fileobj.write
+        for piece in self.generate():
+            write(piece)
+
     @property
     def last_feed_str(self):
         """
@@ -307,6 +351,10 @@ class FeedEntry(object):
     Everywhere where a list is demanded, any iterable can be used.
     """
 
+    __slots__ = ('title', 'title_type', 'content', 'content_type', 'url', 'id',
+                 'updated', 'timezone', 'summary', 'summary_type', 'author',
+                 'published', 'rights', 'links', 'xml_base')
+
     def __init__(self, title=None, content=None, feed_url=None, **kwargs):
         self.title = title
         self.title_type = kwargs.get('title_type', 'text')
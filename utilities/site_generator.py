@@ -8,16 +8,20 @@
 Generates the website files
 '''
 
+import argparse
+import concurrent.futures
 import datetime
+import io
+import json
+import multiprocessing
 import os.path
 import pathlib
 import re
-import shutil
 import string
 import sys
+import time
 
 import markdown  # Python-Markdown: https://github.com/waylan/Python-Markdown
-from packaging.version import Version as VersionSortKey
 
 if __name__ == "__main__" and (__package__ is None or __package__ == ""):
 
@@ -35,6 +39,11 @@ if __name__ == "__main__" and (__package__ is None or __package__ == ""):
 
 from . import pyatom  # pylint: disable=wrong-import-position
 from . import _config_parsing  # pylint: disable=wrong-import-position
+from . import _build_manifest  # pylint: disable=wrong-import-position
+from . import _html_emitter  # pylint: disable=wrong-import-position
+from . import _profiling  # pylint: disable=wrong-import-position
+from . import _site_output  # pylint: disable=wrong-import-position
+from . import _version_index  # pylint: disable=wrong-import-position
 
 _USER_NAME = 'ungoogled-software'
 _REPOSITORY_NAME = 'ungoogled-chromium-binaries'
@@ -60,9 +69,28 @@ _PLATFORMS = _CONFIG / pathlib.Path("platforms")
 _RELEASES = pathlib.Path("releases")
 _DISPLAY_NAME = pathlib.Path("display_name")
 _INSTALL_INFO = pathlib.Path("install_info")
+_FEED_ARCHIVE = _RELEASES / pathlib.Path("feed_archive")
+_RELEASE_INDEX = _RELEASES / pathlib.Path("releases.json")
+_LATEST_RELEASE = pathlib.Path("latest.json")
+# Bump when the layout of the JSON release index changes incompatibly
+_RELEASE_INDEX_FORMAT = 1
+# Number of entries in the current feed and in each of its archive pages
+_FEED_PAGE_SIZE = 50
+# Build state that is kept between builds, but must not be published
+_CACHE_DIR = pathlib.Path(".cache")
+_MANIFEST = _CACHE_DIR / pathlib.Path("manifest.json")
+_CONFIG_CACHE = _CACHE_DIR / pathlib.Path("parsed_config.pickle")
+_PROFILE_REPORT = pathlib.Path("build_profile.json")
+# The first one is the default
+_BACKENDS = ("html", "markdown")
+# Suffixes of the outputs that get precompressed variants
+_PRECOMPRESSED_SUFFIXES = (_OUTPUT_SUFFIX, ".xml")
+_PAGE_TEMPLATE_PATHS = (_INDEX_FRONTPAGE, _INDEX_DIRECTORY, _OUTPUT_WRAPPER,
+                        _VERSION_INPUT)
 
 # For printing out info and Markdown
 _INDENTATION = "    "
+_FRONT_PAGE_LINK = ("Front page", _ABSOLUTE_URL_PREFIX)
 
 _FEED_CONTENT_TEMPLATE = '''<h2>Release Summary</h2>
 <p>
@@ -90,8 +118,52 @@ class PageFileStringTemplate(string.Template):
         delim=re.escape("$ungoog"), id=string.Template.idpattern)
 
 
+class TemplateRegistry:
+    '''
+    Loads and compiles each page template once
+
+    If check_mtime is True, a template is reloaded when its modification time
+    changes. This is meant for long-running processes that build the site
+    multiple times.
+    '''
+
+    def __init__(self, check_mtime=False):
+        self.check_mtime = check_mtime
+        self._templates = dict()  # Path -> (mtime, PageFileStringTemplate)
+
+    def get(self, template_path):
+        """Returns the compiled template for template_path"""
+        cached = self._templates.get(template_path)
+        if cached is None or self.check_mtime:
+            mtime = template_path.stat().st_mtime_ns
+            if cached is None or cached[0] != mtime:
+                with template_path.open() as input_file:
+                    cached = (mtime, PageFileStringTemplate(input_file.read()))
+                self._templates[template_path] = cached
+        return cached[1]
+
+    def render(self, template_path, **page_subs):
+        """Substitutes page_subs into the template at template_path"""
+        return self.get(template_path).substitute(**page_subs)
+
+
+_TEMPLATES = TemplateRegistry()
+
+
 class PlatformVersion:
-    def __init__(self, config_path, parent):
+    '''
+    A version INI
+
+    parsed_config is the result of parsing the INI with either
+    parse_version_ini, or parse_version_metadata. In the latter case, or when
+    lazy is True, the files of the version are only parsed when first used.
+    '''
+
+    __slots__ = ('_real_path', 'path', 'parent', 'version', 'display_name',
+                 'publication_time', 'github_author', 'install_info', 'note',
+                 'sort_key', '_files', '_file_count')
+
+    def __init__(self, config_path, parent, parsed_config=None, lazy=False):
         if not config_path.is_file():
             raise FileNotFoundError(str(config_path))
         self._real_path = config_path
@@ -100,10 +172,39 @@ class PlatformVersion:
         self.parent = parent
         self.version = self.path.name
         self.display_name = self.version
+        self.sort_key = _version_index.version_sort_key(self.version)
+
+        if parsed_config is None:
+            if lazy:
+                parsed_config = _config_parsing.parse_version_metadata(
+                    self._real_path)
+            else:
+                parsed_config = _config_parsing.parse_version_ini(
+                    self._real_path)
+        (files, self.publication_time, self.github_author, self.install_info,
+         self.note) = parsed_config
+        # parse_version_metadata returns the number of files instead
+        if isinstance(files, int):
+            self._files = None
+            self._file_count = files
+        else:
+            self._files = files
+            self._file_count = len(files)
 
-        (self.files, self.publication_time, self.github_author,
-         self.install_info, self.note) = _config_parsing.parse_version_ini(
-             self._real_path)
+    @property
+    def files(self):
+        """
+        Mapping of file name to FileEntry, which unpacks like a
+        (URL, dict of hash name to hash) tuple
+        """
+        if self._files is None:
+            self._files = _config_parsing.parse_version_ini(
+                self._real_path)[0]
+        return self._files
+
+    @property
+    def file_count(self):
+        return self._file_count
 
     def __lt__(self, other):
         return self.version < other.version
@@ -115,25 +216,30 @@ class PlatformVersion:
         return str(self)
 
 
-def _version_sorting_key(ini_path):
-    version_without_dashes = ini_path.stem.replace("-", ".")
-    version_without_characters = re.sub(r'[a-zA-Z]', '', version_without_dashes)
+class PlatformDirectory:
+    '''
+    A directory of platform versions and subdirectories
 
-    """
-    Returns a comparable object representing the sorting key for the INI path
-    """
-    return VersionSortKey(version_without_characters)
+    Properties that depend on the ancestors of the directory (display names,
+    inherited install_info and navigation links) are computed once here, and
+    reused by every page beneath the directory.
+    '''
 
+    __slots__ = ('_real_path', 'path', 'parent', 'children', 'versions',
+                 'display_name', 'install_info', 'name', 'display_names',
+                 'full_display_name', 'effective_install_info',
+                 'navigation_markdown', 'navigation_html', 'input_hashes')
 
-class PlatformDirectory:
-    def __init__(self, dir_path, parent):
+    def __init__(self, dir_path, parent, parsed_configs=None, lazy=False):
         if not dir_path.is_dir():
             raise NotADirectoryError(str(dir_path))
         self._real_path = dir_path
+        # Set on the root directory by read_config()
+        self.input_hashes = None
         self.path = self._real_path.relative_to(_PLATFORMS)
         self.parent = parent
         self.children = list()
-        self.versions = list()  # Latest version is first
+        self.versions = _version_index.VersionIndex()  # Latest version is first
 
         with (dir_path / _DISPLAY_NAME).open() as display_name_file:
             self.display_name = display_name_file.read().splitlines()[0]
@@ -142,30 +248,53 @@ class PlatformDirectory:
         if (dir_path / _INSTALL_INFO).exists():
             self.install_info = (dir_path / _INSTALL_INFO).read_text().strip()
 
-        for config_path in sorted(
-                self._real_path.glob("*.ini"),
-                key=_version_sorting_key,
-                reverse=True):
-            print("Parsing version ini: {}".format(str(config_path)))
-            new_version = PlatformVersion(config_path, self)
-            self.versions.append(new_version)
+        navigation_link = (self.display_name, _get_node_weburl(self))
+        if parent is None:
+            # The root directory is not part of the display names
+            self.display_names = tuple()
+            self.effective_install_info = self.install_info or None
+            parent_markdown = "[{}]({})".format(*_FRONT_PAGE_LINK)
+            parent_html = _html_emitter.link(*_FRONT_PAGE_LINK)
+        else:
+            self.display_names = parent.display_names + (self.display_name, )
+            self.effective_install_info = (self.install_info
+                                           or parent.effective_install_info)
+            parent_markdown = parent.navigation_markdown
+            parent_html = parent.navigation_html
+        self.full_display_name = " ".join(self.display_names)
+        self.navigation_markdown = parent_markdown + " / [{}]({})".format(
+            *navigation_link)
+        if (parent_html is None
+                or not _html_emitter.is_literal_link(*navigation_link)):
+            # Only the Markdown navigation is correct for this display name
+            self.navigation_html = None
+        else:
+            self.navigation_html = parent_html + " / " + _html_emitter.link(
+                *navigation_link)
+
+        for config_path in sorted(self._real_path.glob("*.ini")):
+            if parsed_configs is None:
+                print("Parsing version ini: {}".format(str(config_path)))
+                new_version = PlatformVersion(config_path, self, lazy=lazy)
+            else:
+                new_version = PlatformVersion(config_path, self,
+                                              parsed_configs[config_path])
+            self.versions.insert(new_version)
 
     def __lt__(self, other):
         return self.path < other.path
 
-    def recursively_read_children(self):
+    def recursively_read_children(self, parsed_configs=None, lazy=False):
         for entry in self._real_path.iterdir():
             if entry.is_dir():
-                tmp_dir = PlatformDirectory(entry, self)
-                tmp_dir.recursively_read_children()
+                tmp_dir = PlatformDirectory(entry, self, parsed_configs, lazy)
+                tmp_dir.recursively_read_children(parsed_configs, lazy)
                 self.children.append(tmp_dir)
         self.children.sort()
 
     @property
     def latest_version(self):
-        if not self.versions:
-            return None
-        return self.versions[0]
+        return self.versions.latest()
 
     def __str__(self):
         return "Directory: {}".format(str(self.path))
@@ -174,10 +303,127 @@ class PlatformDirectory:
         return str(self)
 
 
-def read_config():
-    root_dir = PlatformDirectory(_PLATFORMS, None)
-    root_dir.name = _RELEASES.name
-    root_dir.recursively_read_children()
+def _process_pool_executor(jobs):
+    """
+    Returns a ProcessPoolExecutor with the given number of workers.
+
+    Workers are forked where possible, since they cannot re-import this
+    package on their own when it is run as a script.
+    """
+    mp_context = None
+    if "fork" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("fork")
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, mp_context=mp_context)
+
+
+def _get_chunksize(item_count, jobs):
+    # Amortize the IPC overhead while still balancing work across workers
+    return max(1, item_count // (jobs * 4))
+
+
+def _discover_ini_paths():
+    return sorted(_PLATFORMS.rglob("*.ini"))
+
+
+def _parse_ini_files(ini_paths, jobs, lazy=False):
+    """
+    Parses the INIs in ini_paths across jobs worker processes.
+    If lazy is True, only their metadata is parsed.
+    """
+    if lazy:
+        parse_function = _config_parsing.parse_version_metadata
+    else:
+        parse_function = _config_parsing.parse_version_ini
+    if jobs <= 1 or len(ini_paths) <= 1:
+        parsed_configs = dict()
+        for config_path in ini_paths:
+            print("Parsing version ini: {}".format(str(config_path)))
+            parsed_configs[config_path] = parse_function(config_path)
+        return parsed_configs
+    print("Parsing {} version inis with {} jobs".format(
+        len(ini_paths), jobs))
+    with _process_pool_executor(jobs) as executor:
+        parsed_configs = executor.map(
+            parse_function,
+            ini_paths,
+            chunksize=_get_chunksize(len(ini_paths), jobs))
+        return dict(zip(ini_paths, parsed_configs))
+
+
+def _hash_inputs(ini_paths):
+    """
+    Returns the content hashes of the INIs in ini_paths, the display_name and
+    install_info files of the tree and the page templates, keyed by path like
+    in the build manifest
+
+    Inputs are hashed before they are read, so that a file that changes
+    during a build is still seen as changed by the next incremental build.
+    """
+    input_paths = list(ini_paths)
+    input_paths.extend(_PLATFORMS.rglob(_DISPLAY_NAME.name))
+    input_paths.extend(_PLATFORMS.rglob(_INSTALL_INFO.name))
+    input_paths.extend(_PAGE_TEMPLATE_PATHS)
+    return {
+        str(x): _build_manifest.hash_bytes(x.read_bytes())
+        for x in input_paths
+    }
+
+
+def _read_ini_files(ini_paths, jobs, cache_path, lazy):
+    """
+    Returns the parsed configs of ini_paths, using the cache if given.
+    The cache only holds fully parsed INIs, so with lazy, INIs that are not
+    in the cache are not added to it.
+    """
+    if cache_path is None:
+        return _parse_ini_files(ini_paths, jobs, lazy)
+    else:
+        cache = _config_parsing.ParsedConfigCache.load(cache_path)
+        parsed_configs = dict()
+        for config_path in ini_paths:
+            parsed_config = cache.get(config_path)
+            if parsed_config is not None:
+                parsed_configs[config_path] = parsed_config
+        new_configs = _parse_ini_files(
+            [x for x in ini_paths if x not in parsed_configs], jobs, lazy)
+        if not lazy:
+            for config_path, parsed_config in new_configs.items():
+                cache.put(config_path, parsed_config)
+        parsed_configs.update(new_configs)
+        cache.prune(ini_paths)
+        cache.save(cache_path)
+        return parsed_configs
+
+
+def read_config(jobs=1, cache_path=None, profiler=None, lazy=False):
+    """
+    Reads the platform configuration tree.
+
+    All version INIs are discovered first and parsed across jobs worker
+    processes before the tree is assembled. None uses all available CPUs.
+
+    If cache_path is given, parsed INIs are cached there, and only new or
+    modified INIs are parsed again.
+
+    If profiler is a BuildProfiler, the time of each phase is recorded in it.
+
+    If lazy is True, only the metadata of the versions is read up front, and
+    the files of each version are parsed when first used.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    with _profiling.phase(profiler, "tree discovery"):
+        ini_paths = _discover_ini_paths()
+    with _profiling.phase(profiler, "input hashing"):
+        input_hashes = _hash_inputs(ini_paths)
+    with _profiling.phase(profiler, "ini parsing"):
+        parsed_configs = _read_ini_files(ini_paths, jobs, cache_path, lazy)
+    with _profiling.phase(profiler, "tree assembly and sorting"):
+        root_dir = PlatformDirectory(_PLATFORMS, None, parsed_configs, lazy)
+        root_dir.name = _RELEASES.name
+        root_dir.input_hashes = input_hashes
+        root_dir.recursively_read_children(parsed_configs, lazy)
     return root_dir
 
 
@@ -217,169 +463,298 @@ def _get_node_weburl(node, prefix=_ABSOLUTE_URL_PREFIX):
     return prefix + _RELEASES.name + "/" + "/".join(node.path.parts)
 
 
-def _write_output_file(target_path, md_content):
-    page_subs = dict(
-        title=md_content.splitlines()[0][1:].strip(),
-        github_markdown_css=_ABSOLUTE_URL_PREFIX + "github-markdown.css",
-        body=markdown.markdown(
-            md_content,
+_MARKDOWN_CONVERTER = None
+
+
+def _get_markdown_converter():
+    """
+    Returns the Markdown converter of this process.
+    Setting up the extensions of a converter costs more than converting a page.
+    """
+    global _MARKDOWN_CONVERTER  # pylint: disable=global-statement
+    if _MARKDOWN_CONVERTER is None:
+        _MARKDOWN_CONVERTER = markdown.Markdown(
             extensions=[
                 "markdown.extensions.tables",
             ],
-            output_format="xhtml5"))
-    with _OUTPUT_WRAPPER.open() as input_file:
-        content = PageFileStringTemplate(
-            input_file.read()).substitute(**page_subs)
-    with target_path.open("w") as output_file:
-        output_file.write(content)
+            output_format="xhtml5")
+    return _MARKDOWN_CONVERTER
 
 
-def _write_frontpage_index(root_dir):
-    target_path = _OUTPUT_INDEX
+def _render_output_page(md_content, fragments=None):
+    """
+    Converts the Markdown content of a page into the final HTML page
+
+    fragments is the HtmlFragments the page content was built with, if any.
+    """
+    body = _get_markdown_converter().reset().convert(md_content)
+    if fragments is not None:
+        body = fragments.substitute(body)
+    page_subs = dict(
+        title=md_content.splitlines()[0][1:].strip(),
+        github_markdown_css=_ABSOLUTE_URL_PREFIX + "github-markdown.css",
+        body=body)
+    return _TEMPLATES.render(_OUTPUT_WRAPPER, **page_subs)
+
+
+def _timed_render_output_page(md_content, fragments=None):
+    """Returns the HTML page and the seconds it took to render"""
+    start_time = time.perf_counter()
+    content = _render_output_page(md_content, fragments)
+    return content, time.perf_counter() - start_time
+
+
+def _render_output_pages(md_contents, page_fragments, jobs):
+    """
+    Renders the Markdown contents of pages across jobs worker processes.
+    Yields the HTML pages and their render times in seconds, in the same
+    order as md_contents.
+    """
+    if jobs > 1 and len(md_contents) > 1:
+        # Load the wrapper before forking so the workers inherit it
+        _TEMPLATES.get(_OUTPUT_WRAPPER)
+        with _process_pool_executor(jobs) as executor:
+            yield from executor.map(
+                _timed_render_output_page,
+                md_contents,
+                page_fragments,
+                chunksize=_get_chunksize(len(md_contents), jobs))
+    else:
+        yield from map(_timed_render_output_page, md_contents,
+                       page_fragments)
 
-    download_markdown = str()
 
-    download_markdown += 'Platform|Latest version\n'
-    download_markdown += ':--|:--\n'  # Define table columns and alignment
+def _get_directory_index_path(directory_node):
+    return _RELEASES / directory_node.path / _OUTPUT_INDEX
+
+
+def _get_version_page_path(version_node):
+    return _RELEASES / version_node.path.parent / (
+        version_node.version + _OUTPUT_SUFFIX)
+
+
+def _get_latest_release_path(directory_node):
+    return _RELEASES / directory_node.path / _LATEST_RELEASE
+
+
+def _are_literal_links(links):
+    """Returns True if all (text, URL) links can be emitted directly as HTML"""
+    return all(_html_emitter.is_literal_link(*x) for x in links)
+
+
+def _get_frontpage_index(root_dir, fragments=None):
+    """
+    Returns the Markdown content of the front page
+
+    If fragments is a HtmlFragments, machine-generated parts of the page are
+    emitted directly as HTML into it.
+    """
+    download_rows = list()
     for node in preorder_traversal(root_dir):
         if node == root_dir or not node.versions:
             continue
-        download_markdown += "**[{}]({})**".format(
-            " ".join(_get_display_names(node)), _get_node_weburl(node))
-        download_markdown += "|"
         current_version = node.latest_version
         if not current_version:
             raise ValueError("Node has no latest version: {}".format(
                 _get_display_names(node)))
-        download_markdown += "[{}]({})".format(
-            current_version.version, _get_node_weburl(current_version))
-        download_markdown += "\n"
+        download_rows.append(
+            ((node.full_display_name, _get_node_weburl(node)),
+             (current_version.version, _get_node_weburl(current_version))))
+
+    if fragments is None or not _are_literal_links(
+            link for row in download_rows for link in row):
+        download_markdown = str()
+        download_markdown += 'Platform|Latest version\n'
+        download_markdown += ':--|:--\n'  # Define table columns and alignment
+        for platform_link, version_link in download_rows:
+            download_markdown += "**[{}]({})**".format(*platform_link)
+            download_markdown += "|"
+            download_markdown += "[{}]({})".format(*version_link)
+            download_markdown += "\n"
+    else:
+        download_markdown = fragments.block(
+            _html_emitter.left_aligned_table(
+                ("Platform", "Latest version"),
+                [(_html_emitter.strong(_html_emitter.link(*platform_link)),
+                  _html_emitter.link(*version_link))
+                 for platform_link, version_link in download_rows]))
 
     page_subs = dict(latest_downloads=download_markdown)
-    with _INDEX_FRONTPAGE.open() as input_file:
-        content = PageFileStringTemplate(
-            input_file.read()).substitute(**page_subs)
-    _write_output_file(target_path, content)
-
+    return _TEMPLATES.render(_INDEX_FRONTPAGE, **page_subs)
 
-def _write_directory_index(directory_node):
-    target_path = _RELEASES / directory_node.path / _OUTPUT_INDEX
 
-    markdown_urls = list()
-    current_node = directory_node
-    while not current_node is None:
-        markdown_urls.insert(
-            0, "[{}]({})".format(current_node.display_name,
-                                 _get_node_weburl(current_node)))
-        current_node = current_node.parent
-    markdown_urls.insert(0, "[Front page]({})".format(_ABSOLUTE_URL_PREFIX))
+def _get_navigation(node, fragments):
+    """Returns the navigation links from the front page down to node"""
+    if isinstance(node, PlatformVersion):
+        navigation_link = (node.display_name, _get_node_weburl(node))
+        if (fragments is None or node.parent.navigation_html is None
+                or not _html_emitter.is_literal_link(*navigation_link)):
+            return node.parent.navigation_markdown + " / [{}]({})".format(
+                *navigation_link)
+        return fragments.inline(node.parent.navigation_html + " / " +
+                                _html_emitter.link(*navigation_link))
+    if fragments is None or node.navigation_html is None:
+        return node.navigation_markdown
+    return fragments.inline(node.navigation_html)
+
+
+def _get_link_list(links, fragments):
+    """Returns a bullet list of (text, URL) links"""
+    if fragments is None or not _are_literal_links(links):
+        return "".join("* [{}]({})\n".format(*x) for x in links)
+    return fragments.block(
+        _html_emitter.bullet_list(
+            (_html_emitter.link(*x), None) for x in links))
+
+
+def _get_directory_index(directory_node, fragments=None):
+    """
+    Returns the Markdown content of the index page of a directory
 
+    If fragments is a HtmlFragments, machine-generated parts of the page are
+    emitted directly as HTML into it.
+    """
     versions_list_markdown = str()
     if len(directory_node.versions) > 0:
         versions_list_markdown = "## Available versions\n\n"
-        for version in directory_node.versions:
-            versions_list_markdown += "* [{}]({})\n".format(
-                version.version, _get_node_weburl(version))
+        versions_list_markdown += _get_link_list(
+            [(version.version, _get_node_weburl(version))
+             for version in directory_node.versions], fragments)
 
     directory_list_markdown = str()
     if len(directory_node.children) > 0:
         directory_list_markdown = "## Subgroupings\n\n"
-        for subdirectory in directory_node.children:
-            directory_list_markdown += "* [{}]({})\n".format(
-                subdirectory.display_name, _get_node_weburl(subdirectory))
+        directory_list_markdown += _get_link_list(
+            [(subdirectory.display_name, _get_node_weburl(subdirectory))
+             for subdirectory in directory_node.children], fragments)
 
     page_subs = dict(
-        current_path=" / ".join(markdown_urls),
+        current_path=_get_navigation(directory_node, fragments),
         versions_list=versions_list_markdown,
         directory_list=directory_list_markdown)
-    with _INDEX_DIRECTORY.open() as input_file:
-        content = PageFileStringTemplate(
-            input_file.read()).substitute(**page_subs)
-    _write_output_file(target_path, content)
+    return _TEMPLATES.render(_INDEX_DIRECTORY, **page_subs)
 
 
 def _get_display_names(node):
-    display_names = list()
     if isinstance(node, PlatformVersion):
-        current_node = node.parent
+        return list(node.parent.display_names)
     elif isinstance(node, PlatformDirectory):
-        current_node = node
-    else:
-        raise ValueError("Unknown node type {}".format(type(node).__name__))
-    while not current_node.parent is None:
-        display_names.insert(0, current_node.display_name)
-        current_node = current_node.parent
-    return display_names
-
-
-def _write_version_page(version_node):
-    target_path = _RELEASES / version_node.path.parent / (
-        version_node.version + _OUTPUT_SUFFIX)
+        return list(node.display_names)
+    raise ValueError("Unknown node type {}".format(type(node).__name__))
+
+
+def _is_literal_download_list(files):
+    """Returns True if the download list can be emitted directly as HTML"""
+    for filename, (url, hashes) in files.items():
+        if not _html_emitter.is_literal_link(filename, url):
+            return False
+        for hashname, hash_value in hashes.items():
+            if (not _html_emitter.is_literal_text(hashname)
+                    or "`" in hash_value):
+                return False
+    return True
+
+
+def _get_download_list(files, fragments):
+    """Returns the list of downloads and their hashes"""
+    if fragments is None or not _is_literal_download_list(files):
+        download_list_markdown = str()
+        for filename in sorted(files.keys()):
+            url, hashes = files[filename]
+            download_list_markdown += "* [{}]({})\n".format(filename, url)
+            for hashname in sorted(hashes.keys()):
+                download_list_markdown += _INDENTATION + "* {}: `{}`\n".format(
+                    hashname, hashes[hashname])
+        return download_list_markdown
+    if not files:
+        return str()
+    download_items = list()
+    for filename in sorted(files.keys()):
+        url, hashes = files[filename]
+        hash_list_html = None
+        if hashes:
+            hash_list_html = _html_emitter.bullet_list(
+                ("{}: {}".format(
+                    _html_emitter.escape_text(hashname),
+                    _html_emitter.code(hashes[hashname])), None)
+                for hashname in sorted(hashes.keys()))
+        download_items.append((_html_emitter.link(filename, url),
+                               hash_list_html))
+    return fragments.block(_html_emitter.bullet_list(download_items))
+
+
+def _get_version_page(version_node, fragments=None):
+    """
+    Returns the Markdown content of the page of a version
 
-    markdown_urls = list()
-    install_info = None
-    current_node = version_node
-    while not current_node is None:
-        markdown_urls.insert(
-            0, "[{}]({})".format(current_node.display_name,
-                                 _get_node_weburl(current_node)))
-        if not install_info and current_node.install_info:
-            install_info = current_node.install_info
-        current_node = current_node.parent
-    if not install_info:
-        install_info = "*(unspecified)*"
-    markdown_urls.insert(0, "[Front page]({})".format(_ABSOLUTE_URL_PREFIX))
+    If fragments is a HtmlFragments, machine-generated parts of the page are
+    emitted directly as HTML into it.
+    """
+    install_info = (version_node.install_info
+                    or version_node.parent.effective_install_info
+                    or "*(unspecified)*")
 
     if version_node.publication_time:
-        publication_time_markdown = '`{}`'.format(
-            version_node.publication_time.isoformat(sep=' '))
+        publication_time = version_node.publication_time.isoformat(sep=' ')
+        if fragments is None:
+            publication_time_markdown = '`{}`'.format(publication_time)
+        else:
+            publication_time_markdown = fragments.inline(
+                _html_emitter.code(publication_time))
     else:
         publication_time_markdown = '*(unspecified)*'
     if version_node.github_author:
         if version_node.github_author == 'github-actions':
             url = list(version_node.files.values())[0][0]
             github_repo_url = re.sub(r'\/releases\/.+', '', url)
-
-            github_author_markdown = '[GitHub Actions]({url})'.format(url=github_repo_url + '/actions')
+            author_links = (('GitHub Actions', github_repo_url + '/actions'), )
+            author_template = '{}'
         else:
-            github_author_markdown = '[{author}](//github.com/{author}) ([view all releases from user](//github.com/{author}/{repository}/releases))'.format(
-                author=version_node.github_author, repository=_REPOSITORY_NAME)
+            author_links = (
+                (version_node.github_author,
+                 '//github.com/{}'.format(version_node.github_author)),
+                ('view all releases from user',
+                 '//github.com/{author}/{repository}/releases'.format(
+                     author=version_node.github_author,
+                     repository=_REPOSITORY_NAME)),
+            )
+            author_template = '{} ({})'
+        if fragments is None or not _are_literal_links(author_links):
+            github_author_markdown = author_template.format(
+                *("[{}]({})".format(*x) for x in author_links))
+        else:
+            github_author_markdown = fragments.inline(
+                author_template.format(
+                    *(_html_emitter.link(*x) for x in author_links)))
     else:
         github_author_markdown = '*(unspecified)*'
     note_markdown = version_node.note
 
-    download_list_markdown = str()
-    for filename in sorted(version_node.files.keys()):
-        url, hashes = version_node.files[filename]
-        download_list_markdown += "* [{}]({})\n".format(filename, url)
-        for hashname in sorted(hashes.keys()):
-            download_list_markdown += _INDENTATION + "* {}: `{}`\n".format(
-                hashname, hashes[hashname])
-
     page_subs = dict(
         version=version_node.version,
-        display_name=" ".join(_get_display_names(version_node)),
-        current_path=" / ".join(markdown_urls),
+        display_name=version_node.parent.full_display_name,
+        current_path=_get_navigation(version_node, fragments),
         author=github_author_markdown,
         publication_time=publication_time_markdown,
         install_info=install_info,
         note=note_markdown,
-        download_list=download_list_markdown)
-    with _VERSION_INPUT.open() as input_file:
-        content = PageFileStringTemplate(
-            input_file.read()).substitute(**page_subs)
-    _write_output_file(target_path, content)
+        download_list=_get_download_list(version_node.files, fragments))
+    return _TEMPLATES.render(_VERSION_INPUT, **page_subs)
+
+
+def _get_feed_updated(version_node):
+    if version_node.publication_time:
+        return version_node.publication_time
+    return datetime.datetime(1, 1, 1, tzinfo=datetime.timezone.utc)
 
 
 def _add_node_to_feed(feed, node_feed):
-    display_name = ' '.join(_get_display_names(node_feed))
+    display_name = node_feed.parent.full_display_name
+    updated_datetime = _get_feed_updated(node_feed)
     if node_feed.publication_time:
         feed_id = node_feed.publication_time.isoformat()
-        updated_datetime = node_feed.publication_time
     else:
         feed_id = 'unspecified'
-        updated_datetime = datetime.datetime(
-            1, 1, 1, tzinfo=datetime.timezone.utc)
     feed_id += node_feed.version
     feed_id += display_name.replace(" ", '')
     feed.add(
@@ -389,7 +764,7 @@ def _add_node_to_feed(feed, node_feed):
         ),
         content=_FEED_CONTENT_TEMPLATE.format(
             author=(node_feed.github_author or '(unspecified)'),
-            file_count=len(node_feed.files)),
+            file_count=node_feed.file_count),
         content_type='html',
         updated=updated_datetime,
         url=_get_node_weburl(node_feed, prefix=_HOMEPAGE_URL),
@@ -397,41 +772,747 @@ def _add_node_to_feed(feed, node_feed):
     )
 
 
-def write_website(root_dir, feed_path):
-    if _RELEASES.exists():
-        if not _RELEASES.is_dir():
-            raise NotADirectoryError(
-                "The releases directory is not a directory")
-        shutil.rmtree(str(_RELEASES))
+def _get_feed_versions(root_dir):
+    """Returns every version in the tree from oldest to newest"""
+    return sorted(
+        (x for x in preorder_traversal(root_dir, include_versions=True)
+         if isinstance(x, PlatformVersion)),
+        key=lambda x: (_get_feed_updated(x), str(x.path)))
+
+
+def _get_feed_archive_path(page_number):
+    return _FEED_ARCHIVE / "{}.xml".format(page_number)
+
+
+def _get_feed_archive_url(page_number):
+    return _HOMEPAGE_URL + _get_feed_archive_path(page_number).as_posix()
+
 
+def _get_feed_archive_versions(feed_versions, page_size, page_number):
+    """
+    Returns the versions in the archive page page_number, oldest first.
+
+    Archive pages are numbered from 1, and each holds page_size versions
+    in order of publication. Only full pages are archived.
+    """
+    return feed_versions[(page_number - 1) * page_size:page_number *
+                         page_size]
+
+
+def _get_feed_document(versions, feed_url, links, archive=False):
+    """Returns an AtomFeed of versions, newest first"""
     feed = pyatom.AtomFeed(
         title='ungoogled-chromium Binary Downloads',
         subtitle='Feed of contributor-submitted binaries',
-        feed_url=_HOMEPAGE_URL + _FEED_FILE,
-        url=_HOMEPAGE_URL)
+        feed_url=feed_url,
+        url=_HOMEPAGE_URL,
+        links=links,
+        archive=archive)
+    for version in reversed(versions):
+        _add_node_to_feed(feed, version)
+    return feed
+
+
+def _get_current_feed(feed_versions, page_size):
+    links = list()
+    archive_count = len(feed_versions) // page_size
+    if archive_count:
+        links.append({
+            'href': _get_feed_archive_url(archive_count),
+            'rel': 'prev-archive'
+        })
+    return _get_feed_document(feed_versions[-page_size:],
+                              _HOMEPAGE_URL + _FEED_FILE, links)
+
+
+def _get_archive_feed(feed_versions, page_size, page_number):
+    # Archive pages do not link to the next page, so that they never change
+    # once written unless their own versions change
+    links = [{'href': _HOMEPAGE_URL + _FEED_FILE, 'rel': 'current'}]
+    if page_number > 1:
+        links.append({
+            'href': _get_feed_archive_url(page_number - 1),
+            'rel': 'prev-archive'
+        })
+    return _get_feed_document(
+        _get_feed_archive_versions(feed_versions, page_size, page_number),
+        _get_feed_archive_url(page_number),
+        links,
+        archive=True)
+
+
+def get_feed(root_dir, page_size=_FEED_PAGE_SIZE):
+    """
+    Returns the current AtomFeed, which contains the newest page_size versions
+    across all directories.
 
-    for node in preorder_traversal(root_dir, include_versions=True):
-        if isinstance(node, PlatformDirectory):
-            (_RELEASES / node.path).mkdir()
-            _write_directory_index(node)
-            if node.latest_version:
-                _add_node_to_feed(feed, node.latest_version)
-        elif isinstance(node, PlatformVersion):
-            _write_version_page(node)
+    Older versions are in the archive pages of RFC 5005, linked from the
+    current feed through prev-archive links.
+    """
+    return _get_current_feed(_get_feed_versions(root_dir), page_size)
+
+
+def _dump_json(obj):
+    return json.dumps(obj, separators=(',', ':')) + "\n"
+
+
+def _get_publication_time_string(version_node):
+    if version_node.publication_time:
+        return version_node.publication_time.isoformat()
+    return None
+
+
+def _get_release_index(root_dir):
+    """
+    Returns the JSON of releases.json, which lists the latest version of each
+    directory, and where to find its details
+    """
+    platforms = list()
+    for node in preorder_traversal(root_dir):
+        latest_version = node.latest_version
+        if not latest_version:
+            continue
+        platforms.append({
+            'path': node.path.as_posix(),
+            'display_name': node.full_display_name,
+            'url': _get_node_weburl(node, prefix=_HOMEPAGE_URL),
+            'latest_version': latest_version.version,
+            'publication_time': _get_publication_time_string(latest_version),
+            'latest_url': _HOMEPAGE_URL +
+            _get_latest_release_path(node).as_posix(),
+        })
+    return _dump_json({
+        'format': _RELEASE_INDEX_FORMAT,
+        'platforms': platforms,
+    })
+
+
+def _get_latest_release(directory_node):
+    """Returns the JSON of the latest.json of directory_node"""
+    version_node = directory_node.latest_version
+    files = list()
+    for filename in sorted(version_node.files.keys()):
+        url, hashes = version_node.files[filename]
+        files.append({
+            'name': filename,
+            'url': url,
+            'hashes': {x: hashes[x]
+                       for x in sorted(hashes.keys())},
+        })
+    return _dump_json({
+        'format': _RELEASE_INDEX_FORMAT,
+        'path': directory_node.path.as_posix(),
+        'display_name': directory_node.full_display_name,
+        'version': version_node.version,
+        'publication_time': _get_publication_time_string(version_node),
+        'github_author': version_node.github_author,
+        'url': _get_node_weburl(version_node, prefix=_HOMEPAGE_URL),
+        'files': files,
+    })
+
+
+def _get_generator_hash(backend):
+    """Returns a hash of the code that renders the website"""
+    generator_source = bytes()
+    for module in (sys.modules[__name__], pyatom, _config_parsing,
+                   _build_manifest, _html_emitter, _version_index):
+        generator_source += pathlib.Path(module.__file__).read_bytes()
+    generator_source += "".join(map(str, _PAGE_TEMPLATE_PATHS)).encode()
+    generator_source += backend.encode()
+    return _build_manifest.hash_bytes(generator_source)
+
+
+def _get_directory_inputs(directory_node, include_install_info=False):
+    """Returns the input files of directory_node and all of its ancestors"""
+    inputs = list()
+    current_node = directory_node
+    while not current_node is None:
+        inputs.append(current_node._real_path / _DISPLAY_NAME)
+        if include_install_info and current_node.install_info is not None:
+            inputs.append(current_node._real_path / _INSTALL_INFO)
+        current_node = current_node.parent
+    return inputs
+
+
+def _get_frontpage_dependencies(root_dir):
+    dependencies = [_INDEX_FRONTPAGE, _OUTPUT_WRAPPER]
+    key = list()
+    for node in preorder_traversal(root_dir):
+        dependencies.append(node._real_path / _DISPLAY_NAME)
+        if node != root_dir and node.versions:
+            key.append("{} {}".format(node.path, node.latest_version.version))
+    return dependencies, key
+
+
+def _get_directory_dependencies(directory_node):
+    dependencies = [_INDEX_DIRECTORY, _OUTPUT_WRAPPER]
+    dependencies.extend(_get_directory_inputs(directory_node))
+    key = [version.version for version in directory_node.versions]
+    for subdirectory in directory_node.children:
+        dependencies.append(subdirectory._real_path / _DISPLAY_NAME)
+        key.append(str(subdirectory.path))
+    return dependencies, key
+
+
+def _get_release_index_dependencies(root_dir):
+    dependencies = list()
+    key = list()
+    for node in preorder_traversal(root_dir):
+        dependencies.append(node._real_path / _DISPLAY_NAME)
+        if node.latest_version:
+            dependencies.append(node.latest_version._real_path)
+            key.append(str(node.latest_version.path))
+    return dependencies, key
+
+
+def _get_latest_release_dependencies(directory_node):
+    dependencies = [directory_node.latest_version._real_path]
+    dependencies.extend(_get_directory_inputs(directory_node))
+    return dependencies, [str(directory_node.latest_version.path)]
+
+
+def _get_version_dependencies(version_node):
+    dependencies = [_VERSION_INPUT, _OUTPUT_WRAPPER, version_node._real_path]
+    dependencies.extend(
+        _get_directory_inputs(version_node.parent, include_install_info=True))
+    return dependencies, [str(version_node.path)]
+
+
+def _get_feed_dependencies(page_versions, key):
+    """key must identify the page and the links it contains"""
+    dependencies = set()
+    key = list(key)
+    for version in page_versions:
+        dependencies.add(version._real_path)
+        dependencies.update(_get_directory_inputs(version.parent))
+        key.append(str(version.path))
+    return dependencies, key
+
+
+def _is_output_stale(writer, manifest, previous_manifest, target_path,
+                     dependencies, key):
+    """
+    Records the inputs of target_path in the manifest.
+    Returns True if target_path needs to be written again.
+    """
+    for dependency in dependencies:
+        manifest.hash_input(dependency)
+    manifest.record(target_path, dependencies, key)
+    if not manifest.is_fresh(target_path, previous_manifest):
+        return True
+    return not writer.exists(target_path)
+
+
+class _SiteWriter:
+    """
+    Writes the output files of the website
+
+    Files under the releases directory are staged and swapped into place
+    together by commit(). Files outside of it are replaced atomically one by
+    one after the swap. Files whose contents did not change are not written.
+
+    For each encoding in precompress, pages and feeds also get a compressed
+    variant beside them, which is compressed in worker threads. The variants
+    of files that did not change are kept as they are.
+    """
+
+    def __init__(self, precompress=()):
+        self._releases = _site_output.StagedOutput(_RELEASES)
+        self._other_files = list()  # (Path, bytes)
+        self._other_streams = list()  # (Path, temporary file path)
+        self._other_kept = list()  # Path
+        self._precompress = tuple(precompress)
+        self._compression_executor = None
+        self._compression_futures = list()
+
+    def begin(self):
+        self._releases.begin()
+        if self._precompress:
+            self._compression_executor = concurrent.futures.ThreadPoolExecutor(
+            )
+
+    def exists(self, target_path):
+        """Returns True if target_path exists in the current output"""
+        return target_path.exists()
+
+    def mkdir(self, target_dir):
+        self._releases.mkdir(target_dir.relative_to(_RELEASES))
+
+    def _compress_staged(self, relative_path, changed):
+        """Stages the compressed variants of a staged file of the releases"""
+        if relative_path.suffix not in _PRECOMPRESSED_SUFFIXES:
+            return
+        for encoding in self._precompress:
+            compressed_path = _site_output.get_compressed_path(
+                relative_path, encoding)
+            if not changed and self._releases.has_current(compressed_path):
+                self._releases.keep(compressed_path)
+            else:
+                self._compression_futures.append(
+                    self._compression_executor.submit(
+                        _site_output.write_compressed_file,
+                        self._releases.staging_dir / relative_path, encoding))
+
+    def _compress_other(self, target_path, changed):
+        """Updates the compressed variants of a file outside of the releases"""
+        for encoding in _site_output.COMPRESSED_SUFFIXES:
+            compressed_path = _site_output.get_compressed_path(
+                target_path, encoding)
+            if (encoding not in self._precompress
+                    or target_path.suffix not in _PRECOMPRESSED_SUFFIXES):
+                # Never leave a stale variant behind
+                if compressed_path.exists():
+                    compressed_path.unlink()
+            elif changed or not compressed_path.exists():
+                self._compression_futures.append(
+                    self._compression_executor.submit(
+                        _site_output.write_compressed_file, target_path,
+                        encoding))
+
+    def _wait_for_compression(self):
+        """Returns the number of compressed files written"""
+        futures = self._compression_futures
+        self._compression_futures = list()
+        return sum(x.result() for x in futures)
+
+    def write(self, target_path, content):
+        data = content.encode("UTF-8")
+        if _RELEASES in target_path.parents:
+            relative_path = target_path.relative_to(_RELEASES)
+            self._compress_staged(relative_path,
+                                  self._releases.write(relative_path, data))
         else:
-            print("Unknown node ", node)
+            self._other_files.append((target_path, data))
+
+    def write_stream(self, target_path, write_function):
+        """
+        Writes target_path by calling write_function with a text file object,
+        so that large outputs are not held in memory
+        """
+        if _RELEASES in target_path.parents:
+            relative_path = target_path.relative_to(_RELEASES)
+            self._compress_staged(
+                relative_path,
+                self._releases.write_stream(relative_path, write_function))
+        else:
+            self._other_streams.append(
+                (target_path,
+                 _site_output.write_temp_file(target_path, write_function)))
+
+    def keep(self, target_path):
+        """Keeps the current version of target_path"""
+        if _RELEASES in target_path.parents:
+            relative_path = target_path.relative_to(_RELEASES)
+            self._releases.keep(relative_path)
+            self._compress_staged(relative_path, False)
+        else:
+            self._other_kept.append(target_path)
+
+    def commit(self):
+        """Returns the number of files that changed"""
+        changed_count = self._wait_for_compression()
+        self._releases.commit()
+        changed_count += self._releases.changed_count
+        for target_path, data in self._other_files:
+            changed = _site_output.replace_file_if_changed(target_path, data)
+            changed_count += changed
+            self._compress_other(target_path, changed)
+        for target_path, temp_path in self._other_streams:
+            changed = _site_output.replace_file_with_temp_if_changed(
+                target_path, temp_path)
+            changed_count += changed
+            self._compress_other(target_path, changed)
+        for target_path in self._other_kept:
+            self._compress_other(target_path, False)
+        changed_count += self._wait_for_compression()
+        if self._compression_executor is not None:
+            self._compression_executor.shutdown()
+        return changed_count
+
+    def abort(self):
+        if self._compression_executor is not None:
+            self._compression_executor.shutdown()
+        self._releases.abort()
+        for _, temp_path in self._other_streams:
+            os.unlink(temp_path)
+
+
+class _MemorySiteWriter:
+    """
+    Writes the output files of the website into a MemoryOutput instead of
+    the disk. Its files are replaced with the new build by commit().
+    """
 
-    _write_frontpage_index(root_dir)
-    with feed_path.open('w') as feed_file:
-        feed_file.write(feed.to_string())
+    def __init__(self, memory_output):
+        self._output = memory_output
+        self._files = dict()
+
+    @staticmethod
+    def _get_key(target_path):
+        if target_path.is_absolute():
+            target_path = target_path.relative_to(pathlib.Path.cwd())
+        return target_path.as_posix()
+
+    def begin(self):
+        pass
+
+    def exists(self, target_path):
+        return self._get_key(target_path) in self._output.files
+
+    def mkdir(self, target_dir):
+        pass
+
+    def write(self, target_path, content):
+        self._files[self._get_key(target_path)] = content.encode("UTF-8")
+
+    def write_stream(self, target_path, write_function):
+        text_file = io.StringIO(newline='')
+        write_function(text_file)
+        self.write(target_path, text_file.getvalue())
+
+    def keep(self, target_path):
+        key = self._get_key(target_path)
+        self._files[key] = self._output.files[key]
+
+    def commit(self):
+        """Returns the number of files that changed"""
+        previous_files = self._output.files
+        changed_count = sum(1 for key, data in self._files.items()
+                            if previous_files.get(key) != data)
+        self._output.files = self._files
+        return changed_count
+
+    def abort(self):
+        pass
+
+
+def write_website(root_dir,
+                  feed_path,
+                  incremental=False,
+                  jobs=1,
+                  backend=_BACKENDS[0],
+                  profiler=None,
+                  feed_page_size=_FEED_PAGE_SIZE,
+                  precompress=(),
+                  memory_output=None):
+    """
+    Writes the website for the tree at root_dir.
+
+    If incremental is True, only outputs whose inputs changed since the last
+    build are rendered, and outputs that no longer exist in the tree are
+    removed. Otherwise, every output is rendered again.
+
+    The releases directory is built in a staging directory and swapped into
+    place once complete. Files whose contents did not change are not
+    rewritten, so they keep their modification times.
+
+    Pages are rendered across jobs worker processes; the output is identical
+    regardless of the number of jobs.
+
+    With the "html" backend, machine-generated listings are emitted directly
+    as HTML, and only the rest of each page goes through Markdown. The
+    "markdown" backend converts entire pages through Markdown.
+
+    If profiler is a BuildProfiler, the time of each phase and the render time
+    of each page are recorded in it.
+
+    The feed at feed_path contains the newest feed_page_size versions, and
+    older versions are archived in pages of feed_page_size versions.
+
+    precompress is an iterable of Content-Encodings ("gzip", "br") to
+    write precompressed variants of the pages and feeds in, beside them.
+    Variants are only compressed again when their file changed.
+
+    If memory_output is a MemoryOutput, the website is written into it
+    instead of the disk, and incremental builds use the manifest of the
+    previous build into it.
+    """
+    if backend not in _BACKENDS:
+        raise ValueError("Unknown backend: {}".format(backend))
+    if feed_page_size < 1:
+        raise ValueError("The feed page size must be at least 1")
+    for encoding in precompress:
+        if not _site_output.is_encoding_available(encoding):
+            raise ValueError("Cannot precompress with {}".format(encoding))
+    if precompress and memory_output is not None:
+        raise ValueError("Cannot precompress a website written into memory")
+    generator_hash = _get_generator_hash(backend)
+    manifest = _build_manifest.BuildManifest(generator_hash)
+    if root_dir.input_hashes is not None:
+        # Record the inputs as they were before the tree was read
+        manifest.inputs.update(root_dir.input_hashes)
+    if incremental:
+        if memory_output is None:
+            previous_manifest = _build_manifest.BuildManifest.load(
+                _MANIFEST, generator_hash)
+        elif (memory_output.manifest is not None and
+              memory_output.manifest.generator_hash == generator_hash):
+            previous_manifest = memory_output.manifest
+        else:
+            previous_manifest = _build_manifest.BuildManifest(generator_hash)
+        if not previous_manifest.outputs:
+            print("No usable build manifest found; doing a full build")
+            incremental = False
+    else:
+        previous_manifest = _build_manifest.BuildManifest(generator_hash)
+
+    if memory_output is not None:
+        writer = _MemorySiteWriter(memory_output)
+    elif _RELEASES.exists() and not _RELEASES.is_dir():
+        raise NotADirectoryError("The releases directory is not a directory")
+    else:
+        writer = _SiteWriter(precompress)
+    writer.begin()
+    try:
+        output_count, written_count = _write_website_outputs(
+            root_dir, feed_path, writer, manifest, previous_manifest, jobs,
+            backend, profiler, feed_page_size)
+        with _profiling.phase(profiler, "file writes"):
+            changed_count = writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+    if memory_output is None:
+        _CACHE_DIR.mkdir(exist_ok=True)
+        _site_output.replace_file_if_changed(_MANIFEST,
+                                             manifest.dumps().encode())
+    else:
+        memory_output.manifest = manifest
+    orphans = manifest.orphans(previous_manifest)
+    print("Rendered {} of {} pages, removed {} orphaned outputs, "
+          "{} files changed".format(written_count, output_count, len(orphans),
+                                    changed_count))
 
 
-def main():
-    root_dir = read_config()
+def _write_website_outputs(root_dir, feed_path, writer, manifest,
+                           previous_manifest, jobs, backend, profiler,
+                           feed_page_size):
+    """
+    Stages all outputs of the website with writer.
+    Returns the number of pages rendered, and the total number of pages.
+    """
+    # Directories are created in order while collecting the pages to render
+    output_count = 0
+    page_paths = list()
+    page_contents = list()
+    page_fragments = list()
+
+    def _add_page(target_path, get_page_content, node):
+        fragments = None
+        if backend == "html":
+            fragments = _html_emitter.HtmlFragments()
+        page_paths.append(target_path)
+        page_contents.append(get_page_content(node, fragments))
+        page_fragments.append(fragments)
+
+    with _profiling.phase(profiler, "page preparation"):
+        for node in preorder_traversal(root_dir, include_versions=True):
+            if isinstance(node, PlatformDirectory):
+                writer.mkdir(_RELEASES / node.path)
+                target_path = _get_directory_index_path(node)
+                if _is_output_stale(writer, manifest, previous_manifest,
+                                    target_path,
+                                    *_get_directory_dependencies(node)):
+                    _add_page(target_path, _get_directory_index, node)
+                else:
+                    writer.keep(target_path)
+            elif isinstance(node, PlatformVersion):
+                target_path = _get_version_page_path(node)
+                if _is_output_stale(writer, manifest, previous_manifest,
+                                    target_path,
+                                    *_get_version_dependencies(node)):
+                    _add_page(target_path, _get_version_page, node)
+                else:
+                    writer.keep(target_path)
+            else:
+                print("Unknown node ", node)
+                continue
+            output_count += 1
+        written_count = len(page_paths)
+
+        if _is_output_stale(writer, manifest, previous_manifest,
+                            _OUTPUT_INDEX,
+                            *_get_frontpage_dependencies(root_dir)):
+            _add_page(_OUTPUT_INDEX, _get_frontpage_index, root_dir)
+        else:
+            writer.keep(_OUTPUT_INDEX)
+
+    # The render times of pages rendered in parallel overlap, so the phase
+    # only counts the time spent waiting for them
+    render_start_time = time.perf_counter()
+    for (content, render_seconds), target_path in zip(
+            _render_output_pages(page_contents, page_fragments, jobs),
+            page_paths):
+        if profiler is not None:
+            profiler.add_time("page rendering",
+                              time.perf_counter() - render_start_time)
+            profiler.record_page(target_path, render_seconds,
+                                 len(content.encode()))
+        with _profiling.phase(profiler, "file writes"):
+            writer.write(target_path, content)
+        render_start_time = time.perf_counter()
+
+    with _profiling.phase(profiler, "release index generation"):
+        _write_release_index(root_dir, writer, manifest, previous_manifest)
+
+    with _profiling.phase(profiler, "feed generation"):
+        _write_feeds(feed_path, _get_feed_versions(root_dir), feed_page_size,
+                     writer, manifest, previous_manifest)
+
+    return output_count, written_count
+
+
+def _write_release_index(root_dir, writer, manifest, previous_manifest):
+    """Stages releases.json and the latest.json of each directory with writer"""
+    for node in preorder_traversal(root_dir):
+        if not node.latest_version:
+            continue
+        target_path = _get_latest_release_path(node)
+        if _is_output_stale(writer, manifest, previous_manifest,
+                            target_path,
+                            *_get_latest_release_dependencies(node)):
+            writer.write(target_path, _get_latest_release(node))
+        else:
+            writer.keep(target_path)
+    if _is_output_stale(writer, manifest, previous_manifest, _RELEASE_INDEX,
+                        *_get_release_index_dependencies(root_dir)):
+        writer.write(_RELEASE_INDEX, _get_release_index(root_dir))
+    else:
+        writer.keep(_RELEASE_INDEX)
+
+
+def _write_feeds(feed_path, feed_versions, page_size, writer, manifest,
+                 previous_manifest):
+    """Stages the current feed and the feed archive pages with writer"""
+    archive_count = len(feed_versions) // page_size
+    if archive_count:
+        writer.mkdir(_FEED_ARCHIVE)
+    for page_number in range(1, archive_count + 1):
+        archive_path = _get_feed_archive_path(page_number)
+        if _is_output_stale(
+                writer, manifest, previous_manifest, archive_path,
+                *_get_feed_dependencies(
+                    _get_feed_archive_versions(feed_versions, page_size,
+                                               page_number),
+                    ("archive", str(page_number)))):
+            writer.write_stream(
+                archive_path,
+                _get_archive_feed(feed_versions, page_size,
+                                  page_number).write_to)
+        else:
+            writer.keep(archive_path)
+
+    if _is_output_stale(writer, manifest, previous_manifest, feed_path,
+                        *_get_feed_dependencies(
+                            feed_versions[-page_size:],
+                            ("current", str(archive_count)))):
+        writer.write_stream(feed_path,
+                            _get_current_feed(feed_versions,
+                                              page_size).write_to)
+    else:
+        writer.keep(feed_path)
+
+
+def main(arg_list=None):
+    """CLI entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help=('Only write pages whose inputs changed since the last build, '
+              'and remove pages that no longer exist. '
+              'Falls back to a full build if there is no usable manifest.'))
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=1,
+        help=('Number of worker processes to use. '
+              '0 uses all available CPUs. (Default: %(default)s)'))
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Parse every version INI instead of using the parsed INI cache')
+    parser.add_argument(
+        '--lazy',
+        action='store_true',
+        help=('Only read the metadata of each version INI up front, and parse '
+              'its files when its page is rendered. Useful with '
+              '--incremental, where few version pages are rendered.'))
+    parser.add_argument(
+        '--backend',
+        choices=_BACKENDS,
+        default=_BACKENDS[0],
+        help=('"html" emits generated listings directly as HTML, '
+              '"markdown" converts entire pages through Markdown. '
+              '(Default: %(default)s)'))
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        type=pathlib.Path,
+        const=_PROFILE_REPORT,
+        metavar='REPORT_PATH',
+        help=('Time each phase of the build and the rendering of each page, '
+              'and write a JSON report to REPORT_PATH. '
+              '(Default REPORT_PATH: %(const)s)'))
+    parser.add_argument(
+        '--profile-top',
+        type=int,
+        default=10,
+        metavar='N',
+        help='Number of slowest pages to summarize with --profile. '
+        '(Default: %(default)s)')
+    parser.add_argument(
+        '--precompress',
+        action='append',
+        choices=sorted(_site_output.COMPRESSED_SUFFIXES),
+        default=list(),
+        help=('Also write a variant of each page and feed compressed with '
+              'this Content-Encoding, for servers to send as is. '
+              'Can be given more than once; "br" needs the brotli module.'))
+    parser.add_argument(
+        '--feed-page-size',
+        type=int,
+        default=_FEED_PAGE_SIZE,
+        metavar='N',
+        help=('Number of versions in the feed, and in each of the feed '
+              'archive pages holding older versions. (Default: %(default)s)'))
+    args = parser.parse_args(args=arg_list)
+    if args.jobs < 0:
+        parser.error('--jobs must not be negative')
+    if args.feed_page_size < 1:
+        parser.error('--feed-page-size must be at least 1')
+    for encoding in args.precompress:
+        if not _site_output.is_encoding_available(encoding):
+            parser.error('--precompress {} needs the brotli module'.format(
+                encoding))
+
+    jobs = args.jobs or os.cpu_count() or 1
+    profiler = None
+    if args.profile:
+        profiler = _profiling.BuildProfiler()
+
+    root_dir = read_config(
+        jobs=jobs,
+        cache_path=None if args.no_cache else _CONFIG_CACHE,
+        profiler=profiler,
+        lazy=args.lazy)
 
     #print_config(root_dir)
-    write_website(root_dir,
-                  pathlib.Path(__file__).resolve().parent.parent / _FEED_FILE)
+    write_website(
+        root_dir,
+        pathlib.Path(_FEED_FILE),
+        incremental=args.incremental,
+        jobs=jobs,
+        backend=args.backend,
+        profiler=profiler,
+        feed_page_size=args.feed_page_size,
+        precompress=args.precompress)
+
+    if profiler is not None:
+        profiler.write_report(args.profile)
+        profiler.print_summary(args.profile_top)
+        print("Wrote profile report to {}".format(str(args.profile)))
 
 
 if __name__ == "__main__":